@@ -1,6 +1,13 @@
 from django.contrib import admin
 
-from .models import Signature
+from .models import (
+    FaxCallbackEvent,
+    FaxDeferral,
+    FaxReport,
+    FaxRetry,
+    FaxTransmission,
+    Signature,
+)
 
 
 class SignatureAdmin(admin.ModelAdmin):
@@ -13,4 +20,74 @@ class SignatureAdmin(admin.ModelAdmin):
     search_fields = ("user__email",)
 
 
+class FaxReportAdmin(admin.ModelAdmin):
+    list_display = (
+        "__str__",
+        "timestamp",
+    )
+    date_hierarchy = "timestamp"
+    raw_id_fields = ("message",)
+
+
+class FaxCallbackEventAdmin(admin.ModelAdmin):
+    list_display = (
+        "__str__",
+        "timestamp",
+        "received",
+        "processed",
+        "not_before",
+        "provider",
+    )
+    date_hierarchy = "timestamp"
+    list_filter = (("processed", admin.EmptyFieldListFilter),)
+
+
+class FaxTransmissionAdmin(admin.ModelAdmin):
+    list_display = (
+        "provider_id",
+        "provider",
+        "connection_id",
+        "status",
+        "page_count",
+        "duration",
+        "failure_reason",
+        "queue_wait",
+        "created",
+        "updated",
+        "checked",
+    )
+    list_filter = ("status", "provider", "connection_id")
+    date_hierarchy = "created"
+    raw_id_fields = ("message",)
+    search_fields = ("provider_id",)
+
+
+class FaxRetryAdmin(admin.ModelAdmin):
+    list_display = (
+        "__str__",
+        "attempt",
+        "due",
+        "enqueued",
+    )
+    date_hierarchy = "due"
+    list_filter = (("enqueued", admin.EmptyFieldListFilter),)
+    raw_id_fields = ("message",)
+
+
+class FaxDeferralAdmin(admin.ModelAdmin):
+    list_display = (
+        "__str__",
+        "due",
+        "queued_at",
+        "resend",
+    )
+    list_filter = (("due", admin.EmptyFieldListFilter), "resend")
+    raw_id_fields = ("message",)
+
+
 admin.site.register(Signature, SignatureAdmin)
+admin.site.register(FaxReport, FaxReportAdmin)
+admin.site.register(FaxCallbackEvent, FaxCallbackEventAdmin)
+admin.site.register(FaxTransmission, FaxTransmissionAdmin)
+admin.site.register(FaxRetry, FaxRetryAdmin)
+admin.site.register(FaxDeferral, FaxDeferralAdmin)
@@ -9,13 +9,18 @@ class FroideFaxConfig(AppConfig):
     verbose_name = _("Froide Fax App")
 
     def ready(self):
+        from celery.signals import task_postrun
+        from django.core.signals import request_finished
         from froide.account import account_canceled, account_merged
         from froide.account.export import registry
         from froide.foirequest.models import FoiRequest
 
         from .listeners import connect_message_send
+        from .utils import flush_fax_number_updates
 
         FoiRequest.message_sent.connect(connect_message_send)
+        request_finished.connect(flush_fax_number_updates)
+        task_postrun.connect(flush_fax_number_updates)
 
         account_canceled.connect(cancel_user)
         account_merged.connect(merge_user)
@@ -32,22 +37,26 @@ def cancel_user(sender, user=None, **kwargs):
         sig = Signature.objects.get(user=user)
     except Signature.DoesNotExist:
         return
+    sig.clear_cache()
     sig.remove_signature_file()
     sig.delete()
 
 
 def merge_user(sender, old_user=None, new_user=None, **kwargs):
-    from .models import Signature
+    from .models import Signature, clear_signature_cache
 
     old_exists = Signature.objects.filter(user=old_user).exists()
     new_exists = Signature.objects.filter(user=new_user).exists()
 
     if old_exists and new_exists:
         old_signature = Signature.objects.get(user=old_user)
+        old_signature.clear_cache()
         old_signature.remove_signature_file()
         old_signature.delete()
     elif old_exists:
         Signature.objects.filter(user=old_user).update(user=new_user)
+        clear_signature_cache(old_user.id)
+        clear_signature_cache(new_user.id)
 
 
 def export_user_data(user):
@@ -0,0 +1,537 @@
+import datetime
+import json
+import logging
+import time
+from collections import defaultdict
+from functools import lru_cache, partial
+
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+import pytz
+from nacl.encoding import Base64Encoder
+from nacl.exceptions import BadSignatureError
+from nacl.signing import VerifyKey
+
+from froide.foirequest.models import DeliveryStatus, FoiMessage
+from froide.problem.models import ProblemReport
+
+from .models import FaxCallbackEvent, FaxTransmission
+from .providers import get_fax_provider
+from .retries import (
+    FAILURE_FAIL,
+    MAX_RETRIES,
+    cancel_fax_retries,
+    get_failure_policy,
+    get_retry_delay,
+    schedule_fax_retry,
+)
+from .utils import create_fax_log
+
+logger = logging.getLogger(__name__)
+
+CALLBACK_MODE_SYNC = "sync"
+CALLBACK_MODE_QUEUE = "queue"
+
+EVENT_APPLIED = "applied"
+EVENT_STALE = "stale"
+EVENT_UNKNOWN = "unknown"
+EVENT_DUPLICATE = "duplicate"
+
+SIGNATURE_LENGTH = 64
+UNKNOWN_FAX_RETRY_DELAY = datetime.timedelta(seconds=30)
+
+# Telnyx statuses of one fax only ever move forward in this order
+TERMINAL_STATUS_RANK = 3
+
+
+def get_status_rank(status):
+    if status == "queued":
+        return 0
+    elif status == "media.processed":
+        return 1
+    elif status.startswith("sending"):
+        return 2
+    elif status in ("delivered", "failed"):
+        return TERMINAL_STATUS_RANK
+    return -1
+
+
+def get_unknown_fax_timeout():
+    # seconds queued events for an unknown fax are retried before dropping
+    return getattr(settings, "FROIDE_FAX_CALLBACK_UNKNOWN_TIMEOUT", 10 * 60)
+
+
+def get_callback_mode():
+    return getattr(settings, "FROIDE_FAX_CALLBACK_MODE", CALLBACK_MODE_SYNC)
+
+
+class InvalidCallback(Exception):
+    msg: str
+    status: int
+
+    def __init__(self, msg, status=400, *args, **kwargs):
+        self.msg = msg
+        self.status = status
+        super().__init__(msg, *args, **kwargs)
+
+
+@lru_cache(maxsize=4)
+def get_verify_key(public_key):
+    return VerifyKey(public_key, encoder=Base64Encoder)
+
+
+def get_callback_tolerance():
+    return getattr(settings, "FROIDE_FAX_CALLBACK_TOLERANCE", 300)
+
+
+def verify_telnyx_callback(body, event_timestamp, event_signature, now=None):
+    """
+    Check the Ed25519 signature and the replay window of a webhook.
+    Returns the signing time, raises InvalidCallback before any DB access.
+    """
+    if not event_timestamp or not event_signature:
+        raise InvalidCallback("missing signature headers")
+    try:
+        timestamp = int(event_timestamp)
+        signature = Base64Encoder.decode(event_signature.encode("ascii"))
+    except (ValueError, UnicodeEncodeError):
+        raise InvalidCallback("malformed signature headers")
+    if len(signature) != SIGNATURE_LENGTH:
+        raise InvalidCallback("malformed signature headers")
+
+    if now is None:
+        now = time.time()
+    if abs(now - timestamp) > get_callback_tolerance():
+        raise InvalidCallback("timestamp outside tolerance")
+
+    # prepare signature data for nacl
+    verify_key = get_verify_key(settings.TELNYX_PUBLIC_KEY)
+    callback_bytes = f"{event_timestamp}|".encode("UTF-8") + body
+
+    # verify signature
+    try:
+        verify_key.verify(callback_bytes, signature=signature)
+    except BadSignatureError:
+        raise InvalidCallback("invalid signature", status=403)
+    return parse_event_timestamp(timestamp)
+
+
+def verify_telnyx_signature(request):
+    return verify_telnyx_callback(
+        request.body,
+        request.headers.get("Telnyx-Timestamp"),
+        request.headers.get("Telnyx-Signature-Ed25519"),
+    )
+
+
+def get_delivery_status(status):
+    if status == "failed":
+        return DeliveryStatus.Delivery.STATUS_FAILED
+    elif status == "queued":
+        return DeliveryStatus.Delivery.STATUS_SENDING
+    elif status == "media.processed":
+        return DeliveryStatus.Delivery.STATUS_SENDING
+    elif status.startswith("sending"):
+        return DeliveryStatus.Delivery.STATUS_SENDING
+    elif status == "delivered":
+        return DeliveryStatus.Delivery.STATUS_SENT
+    # again: we should not end up here. according to telnyx-docu those
+    # are all possible stati
+    raise ValueError(f"This is not a valid status response: {status}")
+
+
+def parse_fax_event(payload_json, event_timestamp):
+    """
+    Turn a Telnyx webhook body into the event dict that is applied
+    to fax messages. Raises ValueError on malformed bodies.
+    """
+    try:
+        data = payload_json.get("data")
+        payload = data.get("payload")
+        fax_id = payload.get("fax_id")
+        status = payload.get("status")
+    except AttributeError as e:
+        # these keys should always exist. we should never end up here
+        raise ValueError(
+            f"This is not a valid API response body: {payload_json}"
+        ) from e
+
+    if not fax_id or not status:
+        raise ValueError(f"This is not a valid API response body: {payload_json}")
+
+    # Prefer the time the event occurred over the time it was signed
+    occurred_at = parse_datetime(data.get("occurred_at") or "") or event_timestamp
+
+    # Create machine-readable log
+    log_data = {
+        "from_": payload["from"],
+        "to": payload["to"],
+        "sid": payload["fax_id"],
+        "status": payload["status"],
+        "num_pages": payload.get("page_count", 0),
+        "duration": payload.get("call_duration_secs", 0),
+        "failure_reason": payload.get("failure_reason"),
+        "date_created": data["occurred_at"],
+    }
+    return {
+        "event_id": data.get("id"),
+        "fax_id": fax_id,
+        "provider_status": status,
+        "status": get_delivery_status(status),
+        "rank": get_status_rank(status),
+        "timestamp": occurred_at,
+        "log_data": log_data,
+    }
+
+
+def parse_event_timestamp(event_timestamp):
+    return datetime.datetime.fromtimestamp(int(event_timestamp), pytz.timezone("UTC"))
+
+
+def collapse_events(events):
+    """
+    Keep only the most advanced event per fax, earlier ones
+    would be overwritten in the same batch anyway.
+    """
+    latest = {}
+    for event in events:
+        current = latest.get(event["fax_id"])
+        if current is None or (current["rank"], current["timestamp"]) < (
+            event["rank"],
+            event["timestamp"],
+        ):
+            latest[event["fax_id"]] = event
+    return list(latest.values())
+
+
+def get_current_rank(ds, fax_id):
+    """
+    Rank of the last applied status of a legacy fax attempt without
+    transmission record, -1 if nothing of this attempt was applied yet.
+    """
+    try:
+        log_data = json.loads(ds.log)
+    except ValueError:
+        return -1
+    if not isinstance(log_data, dict) or log_data.get("sid") != fax_id:
+        return -1
+    return get_status_rank(log_data.get("status") or "")
+
+
+def advance_transmission(transmission, event):
+    """
+    Move a transmission forward with one conditional UPDATE that only
+    matches while the stored status ranks below the event's status.
+    """
+    log_data = event["log_data"]
+    lower_statuses = [
+        status
+        for status in FaxTransmission.Status.values
+        if get_status_rank(status) < event["rank"]
+    ]
+    values = {
+        "status": FaxTransmission.get_status(event["provider_status"]),
+        "page_count": log_data["num_pages"] or transmission.page_count,
+        "duration": log_data["duration"] or transmission.duration,
+        "failure_reason": log_data["failure_reason"] or "",
+        "updated": event["timestamp"],
+    }
+    updated = FaxTransmission.objects.filter(
+        pk=transmission.pk, status__in=lower_statuses
+    ).update(**values)
+    if not updated:
+        return False
+    for key, value in values.items():
+        setattr(transmission, key, value)
+    return True
+
+
+def advance_delivery_status(ds, event):
+    """
+    Compare-and-set the delivery status: the UPDATE only matches if
+    nobody changed status or last update since it was read.
+    Unchanged states are skipped without a write. Callers lock the row
+    first; a miss means the lock was not held and raises, so that the
+    surrounding transaction rolls back instead of half applying the event.
+    """
+    log = create_fax_log(ds.log, event["log_data"])
+    if ds.status == event["status"] and ds.log == log:
+        return False
+    updated = DeliveryStatus.objects.filter(
+        pk=ds.pk, status=ds.status, last_update=ds.last_update
+    ).update(status=event["status"], last_update=event["timestamp"], log=log)
+    if not updated:
+        raise DatabaseError("Delivery status %s changed concurrently" % ds.pk)
+    ds.status = event["status"]
+    ds.last_update = event["timestamp"]
+    ds.log = log
+    return True
+
+
+def is_duplicate_event(event_id):
+    if not event_id:
+        return False
+    return FaxCallbackEvent.objects.filter(event_id=event_id).exists()
+
+
+def record_processed_events(event_ids):
+    now = timezone.now()
+    for event_id in event_ids:
+        try:
+            with transaction.atomic():
+                FaxCallbackEvent.objects.create(
+                    event_id=event_id, timestamp=now, processed=now
+                )
+        except IntegrityError:
+            # Processed concurrently
+            pass
+
+
+def process_fax_events(events):
+    """
+    Apply a batch of parsed fax events with one query for the lookup
+    and conditional single-statement updates per changed fax.
+    Events that don't advance the status of their fax are no-ops.
+    Returns a dict of fax id to outcome.
+    """
+    events = collapse_events(events)
+    transmissions, legacy_messages = get_fax_event_targets(
+        [event["fax_id"] for event in events]
+    )
+    outcomes = {}
+    for event in events:
+        outcomes[event["fax_id"]] = apply_fax_event(
+            event, transmissions.get(event["fax_id"]), legacy_messages
+        )
+    return outcomes
+
+
+def get_fax_event_targets(fax_ids):
+    """
+    Look up transmissions and, for faxes sent before transmissions were
+    recorded, messages of the given fax ids.
+    """
+    transmissions = {
+        t.provider_id: t
+        for t in FaxTransmission.objects.filter(provider_id__in=fax_ids).select_related(
+            "message", "message__deliverystatus"
+        )
+    }
+    # Faxes sent before transmissions were recorded
+    legacy_ids = [fax_id for fax_id in fax_ids if fax_id not in transmissions]
+    legacy_messages = {}
+    if legacy_ids:
+        legacy_messages = {
+            m.email_message_id: m
+            for m in FoiMessage.objects.filter(
+                email_message_id__in=legacy_ids
+            ).select_related("deliverystatus")
+        }
+    return transmissions, legacy_messages
+
+
+def apply_fax_event(event, transmission, legacy_messages):
+    if transmission is not None:
+        if get_status_rank(transmission.status) >= event["rank"]:
+            return EVENT_STALE
+        if not advance_transmission(transmission, event):
+            # Advanced concurrently
+            return EVENT_STALE
+        fax_message = transmission.message
+        if fax_message.email_message_id != event["fax_id"]:
+            # Late event of an earlier attempt
+            return EVENT_APPLIED
+    else:
+        fax_message = legacy_messages.get(event["fax_id"])
+        if fax_message is None:
+            logger.warning("Fax callback for unknown fax %s", event["fax_id"])
+            return EVENT_UNKNOWN
+
+    # Lock the status so it can't change between the comparison and the
+    # update below, the transmission may already be advanced
+    ds = DeliveryStatus.objects.select_for_update().filter(message=fax_message).first()
+    if ds is None:
+        ds = DeliveryStatus.objects.create(
+            message=fax_message,
+            status=event["status"],
+            last_update=event["timestamp"],
+            log=create_fax_log("", event["log_data"]),
+        )
+    else:
+        if transmission is None and (
+            get_current_rank(ds, event["fax_id"]) >= event["rank"]
+        ):
+            return EVENT_STALE
+        if not advance_delivery_status(ds, event):
+            if transmission is not None:
+                # Only the transmission had to move
+                return EVENT_APPLIED
+            return EVENT_STALE
+
+    if ds.status == DeliveryStatus.Delivery.STATUS_SENT:
+        fax_message.timestamp = ds.last_update
+        FoiMessage.objects.filter(pk=fax_message.pk).update(
+            timestamp=fax_message.timestamp
+        )
+
+    handle_status_change(
+        fax_message, ds, failure_reason=event["log_data"]["failure_reason"]
+    )
+    return EVENT_APPLIED
+
+
+def process_fax_event(event):
+    """
+    Apply a single event right away.
+    Duplicates cost one indexed lookup and no writes.
+    """
+    if is_duplicate_event(event["event_id"]):
+        return EVENT_DUPLICATE
+    with transaction.atomic():
+        outcome = process_fax_events([event])[event["fax_id"]]
+        if outcome == EVENT_APPLIED and event["event_id"]:
+            record_processed_events([event["event_id"]])
+    return outcome
+
+
+def handle_status_change(fax_message, ds, failure_reason=None):
+    from .tasks import create_fax_thumbnail_task
+
+    if ds.status == DeliveryStatus.Delivery.STATUS_SENT:
+        transaction.on_commit(partial(create_fax_thumbnail_task.delay, fax_message.pk))
+        ProblemReport.objects.find_and_resolve(
+            message=fax_message, kind=ProblemReport.PROBLEM.BOUNCE_PUBLICBODY
+        )
+
+    failed = False
+    if ds.status == DeliveryStatus.Delivery.STATUS_FAILED:
+        policy = get_failure_policy(failure_reason)
+        if policy == FAILURE_FAIL or ds.retry_count >= MAX_RETRIES:
+            failed = True
+            cancel_fax_retries(fax_message)
+        else:
+            schedule_fax_retry(
+                fax_message,
+                get_retry_delay(policy, ds.retry_count),
+                attempt=ds.retry_count + 1,
+            )
+
+    if failed:
+        ProblemReport.objects.report(
+            message=fax_message,
+            kind=ProblemReport.PROBLEM.BOUNCE_PUBLICBODY,
+            description=ds.log,
+            auto_submitted=True,
+        )
+
+
+def enqueue_fax_event(payload_json, event_timestamp, event_id=None, provider="telnyx"):
+    """Store a verified webhook body for batched processing."""
+    from .tasks import process_fax_callback_events_task
+
+    if is_duplicate_event(event_id):
+        return EVENT_DUPLICATE
+    try:
+        with transaction.atomic():
+            FaxCallbackEvent.objects.create(
+                event_id=event_id or None,
+                provider=provider,
+                payload=payload_json,
+                timestamp=event_timestamp,
+            )
+    except IntegrityError:
+        return EVENT_DUPLICATE
+    transaction.on_commit(process_fax_callback_events_task.delay)
+    return None
+
+
+def process_queued_fax_events(batch_size=None):
+    """
+    Apply a batch of queued webhook events.
+    Returns the number of events that were claimed.
+    """
+    if batch_size is None:
+        batch_size = getattr(settings, "FROIDE_FAX_CALLBACK_BATCH_SIZE", 100)
+    now = timezone.now()
+    unknown_cutoff = now - datetime.timedelta(seconds=get_unknown_fax_timeout())
+
+    with transaction.atomic():
+        queued = list(
+            FaxCallbackEvent.objects.select_for_update(skip_locked=True)
+            .filter(processed=None)
+            .filter(Q(not_before=None) | Q(not_before__lte=now))
+            .order_by("timestamp", "id")[:batch_size]
+        )
+        if not queued:
+            return 0
+        events = []
+        queued_by_fax = defaultdict(list)
+        failed = []
+        for queued_event in queued:
+            provider = get_fax_provider(queued_event.provider)
+            if provider is None:
+                logger.error(
+                    "Queued fax event %s of unknown provider %s",
+                    queued_event.pk,
+                    queued_event.provider,
+                )
+                failed.append(queued_event)
+                continue
+            try:
+                event = provider.parse_event(
+                    queued_event.payload, queued_event.timestamp
+                )
+            except ValueError:
+                logger.exception("Invalid queued fax event %s", queued_event.pk)
+                failed.append(queued_event)
+                continue
+            events.append(event)
+            queued_by_fax[event["fax_id"]].append(queued_event)
+
+        events = collapse_events(events)
+        transmissions, legacy_messages = get_fax_event_targets(list(queued_by_fax))
+        applied = []
+        postponed = []
+        for event in events:
+            fax_events = queued_by_fax[event["fax_id"]]
+            try:
+                # One failing event must not roll back or block the batch
+                with transaction.atomic():
+                    outcome = apply_fax_event(
+                        event, transmissions.get(event["fax_id"]), legacy_messages
+                    )
+            except Exception:
+                logger.exception("Applying queued fax event %s failed", event["fax_id"])
+                failed.extend(fax_events)
+                continue
+            if outcome == EVENT_UNKNOWN and all(
+                e.received > unknown_cutoff for e in fax_events
+            ):
+                # The sending worker may not have stored the fax id yet
+                postponed.extend(fax_events)
+            else:
+                applied.extend(fax_events)
+
+        # Keep the event ids as processed-events index, drop the payload
+        FaxCallbackEvent.objects.filter(pk__in=[e.pk for e in applied]).update(
+            processed=now, payload=None
+        )
+        # Failed events keep their payload for inspection
+        FaxCallbackEvent.objects.filter(pk__in=[e.pk for e in failed]).update(
+            processed=now
+        )
+        FaxCallbackEvent.objects.filter(pk__in=[e.pk for e in postponed]).update(
+            not_before=now + UNKNOWN_FAX_RETRY_DELAY
+        )
+    return len(queued)
+
+
+def prune_fax_callback_events():
+    """Drop processed events that can no longer be redelivered."""
+    days = getattr(settings, "FROIDE_FAX_CALLBACK_RETENTION_DAYS", 30)
+    cutoff = timezone.now() - datetime.timedelta(days=days)
+    return FaxCallbackEvent.objects.filter(processed__lt=cutoff).delete()[0]
@@ -0,0 +1,83 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+CIRCUIT_CACHE_PREFIX = "froide_fax:circuit:"
+
+CIRCUIT_CLOSED = "closed"
+CIRCUIT_OPEN = "open"
+CIRCUIT_HALF_OPEN = "half-open"
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker shared through the cache. Opens after `threshold`
+    consecutive failures and lets a single probe through after
+    `reset_timeout` seconds (half-open); a success closes it again.
+    """
+
+    def __init__(self, name, threshold=None, reset_timeout=None):
+        self.key = CIRCUIT_CACHE_PREFIX + name
+        if threshold is None:
+            threshold = getattr(settings, "FROIDE_FAX_CIRCUIT_THRESHOLD", 5)
+        if reset_timeout is None:
+            reset_timeout = getattr(settings, "FROIDE_FAX_CIRCUIT_RESET_TIMEOUT", 60)
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+
+    @property
+    def failures_key(self):
+        return self.key + ":failures"
+
+    @property
+    def open_until_key(self):
+        return self.key + ":open_until"
+
+    @property
+    def probe_key(self):
+        return self.key + ":probe"
+
+    def get_state(self):
+        values = cache.get_many([self.failures_key, self.open_until_key])
+        open_until = values.get(self.open_until_key)
+        if open_until is not None and time.time() < open_until:
+            return CIRCUIT_OPEN
+        if values.get(self.failures_key, 0) >= self.threshold:
+            return CIRCUIT_HALF_OPEN
+        return CIRCUIT_CLOSED
+
+    def is_open(self):
+        return self.get_state() == CIRCUIT_OPEN
+
+    def allow_request(self):
+        state = self.get_state()
+        if state == CIRCUIT_HALF_OPEN:
+            # Only one probe at a time, everyone else waits for its outcome
+            return cache.add(self.probe_key, 1, self.reset_timeout)
+        return state == CIRCUIT_CLOSED
+
+    def record_success(self):
+        cache.delete_many([self.failures_key, self.open_until_key, self.probe_key])
+
+    def record_failure(self):
+        cache.delete(self.probe_key)
+        cache.add(self.failures_key, 0, None)
+        try:
+            failures = cache.incr(self.failures_key)
+        except ValueError:
+            # Evicted in between
+            cache.set(self.failures_key, 1, None)
+            failures = 1
+        if failures >= self.threshold:
+            cache.set(
+                self.open_until_key,
+                time.time() + self.reset_timeout,
+                # Keep the marker a bit longer than the open period
+                self.reset_timeout * 2,
+            )
+        return failures
+
+
+def get_circuit_breaker(name):
+    return CircuitBreaker(name)
@@ -0,0 +1,129 @@
+import logging
+import time
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_API_BASE = "https://api.telnyx.com/v2/"
+
+
+def strip_query(url):
+    """Drop query and fragment, they may carry access tokens"""
+    return urlsplit(url)._replace(query="", fragment="").geturl()
+
+
+class FaxAPIClient:
+    """
+    HTTP client for the fax provider API with keep-alive connection
+    pooling, timeouts and bounded transport retries.
+
+    Connection errors are retried for all methods (the request never
+    reached the server), read errors and 5xx responses only for
+    idempotent methods so a fax is never posted twice.
+    """
+
+    def __init__(
+        self,
+        base_url=None,
+        connect_timeout=None,
+        read_timeout=None,
+        max_retries=None,
+        pool_size=None,
+        label="Fax API",
+    ):
+        self.label = label
+        self.base_url = base_url or getattr(
+            settings, "TELNYX_API_BASE", DEFAULT_API_BASE
+        )
+        if not self.base_url.endswith("/"):
+            self.base_url += "/"
+        self.timeout = (
+            connect_timeout or getattr(settings, "FROIDE_FAX_CONNECT_TIMEOUT", 5),
+            read_timeout or getattr(settings, "FROIDE_FAX_READ_TIMEOUT", 30),
+        )
+        if max_retries is None:
+            max_retries = getattr(settings, "FROIDE_FAX_MAX_RETRIES", 3)
+        if pool_size is None:
+            pool_size = getattr(settings, "FROIDE_FAX_POOL_SIZE", 10)
+        self.session = self.make_session(max_retries, pool_size)
+
+    def make_session(self, max_retries, pool_size):
+        retry = Retry(
+            total=max_retries,
+            connect=max_retries,
+            read=max_retries,
+            status=max_retries,
+            backoff_factor=0.5,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            max_retries=retry, pool_connections=pool_size, pool_maxsize=pool_size
+        )
+        session = requests.Session()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def get_url(self, path):
+        if path.startswith(("http://", "https://")):
+            return path
+        return self.base_url + path.lstrip("/")
+
+    def request(self, method, path, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        url = self.get_url(path)
+        start = time.monotonic()
+        status_code = None
+        try:
+            response = self.session.request(method, url, **kwargs)
+            status_code = response.status_code
+            return response
+        finally:
+            logger.info(
+                "%s %s %s -> %s in %.3fs",
+                self.label,
+                method,
+                strip_query(url),
+                status_code or "error",
+                time.monotonic() - start,
+            )
+
+    def get(self, path, **kwargs):
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request("POST", path, **kwargs)
+
+
+_fax_client = None
+
+
+def get_fax_client():
+    """
+    Return the process-wide fax API client.
+    The class can be swapped via the `FROIDE_FAX_CLIENT` setting.
+    """
+    global _fax_client
+    if _fax_client is None:
+        client_class = getattr(settings, "FROIDE_FAX_CLIENT", None)
+        if client_class is None:
+            client_class = FaxAPIClient
+        elif isinstance(client_class, str):
+            client_class = import_string(client_class)
+        _fax_client = client_class()
+    return _fax_client
+
+
+def set_fax_client(client):
+    """Replace the process-wide client, e.g. with a stub in tests."""
+    global _fax_client
+    _fax_client = client
@@ -0,0 +1,99 @@
+import random
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from .models import FaxTransmission
+
+IN_FLIGHT_STATUSES = (
+    FaxTransmission.Status.QUEUED,
+    FaxTransmission.Status.MEDIA_PROCESSED,
+    FaxTransmission.Status.SENDING,
+)
+# Transmissions older than this no longer count as in flight
+IN_FLIGHT_WINDOW = timedelta(hours=2)
+SUCCESS_WINDOW = timedelta(hours=24)
+
+
+def get_fax_connections():
+    """
+    Configured pairs of provider connection (app id) and sender number.
+    Falls back to the single `TELNYX_APP_ID` / `TELNYX_FROM_NUMBER`.
+    """
+    connections = getattr(settings, "TELNYX_CONNECTIONS", None)
+    if connections:
+        return connections
+    return [
+        {
+            "app_id": settings.TELNYX_APP_ID,
+            "from_number": settings.TELNYX_FROM_NUMBER,
+        }
+    ]
+
+
+def get_connection_ids():
+    return {connection["app_id"] for connection in get_fax_connections()}
+
+
+def get_fax_connection(app_id):
+    for connection in get_fax_connections():
+        if connection["app_id"] == app_id:
+            return connection
+    return None
+
+
+def get_connection_stats(app_ids):
+    now = timezone.now()
+    in_flight = dict(
+        FaxTransmission.objects.filter(
+            connection_id__in=app_ids,
+            status__in=IN_FLIGHT_STATUSES,
+            created__gte=now - IN_FLIGHT_WINDOW,
+        )
+        .values_list("connection_id")
+        .annotate(count=Count("id"))
+    )
+    outcomes = {
+        row["connection_id"]: row
+        for row in FaxTransmission.objects.filter(
+            connection_id__in=app_ids,
+            status__in=(
+                FaxTransmission.Status.DELIVERED,
+                FaxTransmission.Status.FAILED,
+            ),
+            created__gte=now - SUCCESS_WINDOW,
+        )
+        .values("connection_id")
+        .annotate(
+            total=Count("id"),
+            delivered=Count("id", filter=Q(status=FaxTransmission.Status.DELIVERED)),
+        )
+    }
+    return in_flight, outcomes
+
+
+def choose_fax_connection():
+    """
+    Pick the connection with the best mix of free capacity and recent
+    success rate. Connections at their concurrency limit are only used
+    if all are.
+    """
+    connections = get_fax_connections()
+    if len(connections) == 1:
+        return connections[0]
+
+    app_ids = [connection["app_id"] for connection in connections]
+    in_flight, outcomes = get_connection_stats(app_ids)
+
+    def score(connection):
+        app_id = connection["app_id"]
+        capacity = connection.get("max_concurrent", 1)
+        load = in_flight.get(app_id, 0) / capacity
+        outcome = outcomes.get(app_id, {"total": 0, "delivered": 0})
+        # Smoothed so that unused connections get a chance
+        success_rate = (outcome["delivered"] + 1) / (outcome["total"] + 2)
+        return (load < 1, success_rate / (1 + load), random.random())
+
+    return max(connections, key=score)
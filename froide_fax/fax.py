@@ -1,9 +1,12 @@
 import logging
+from datetime import timedelta
 
-import requests
 from django import forms
 from django.conf import settings
+from django.core.cache import cache
 from django.core.files.base import ContentFile
+from django.db import IntegrityError, transaction
+from django.db.models import F
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from froide.foirequest.message_handlers import MessageHandler
@@ -11,24 +14,43 @@ from froide.foirequest.models import DeliveryStatus, FoiAttachment, FoiMessage
 from froide.foirequest.models.message import MessageKind
 from froide.helper.widgets import BootstrapCheckboxInput
 
+from .circuit import get_circuit_breaker
+from .connections import choose_fax_connection, get_fax_connection
 from .forms import SignatureField, save_signature_for_user
-from .pdf_generator import FaxMessagePDFGenerator
+from .models import FaxDeferral, FaxTransmission
+from .pdf_generator import FaxMessagePDFGenerator, get_fax_pdf_cache_key
+from .providers import (
+    FaxFailedException,
+    FaxOutcomeUnknown,
+    ProviderUnavailable,
+    get_fax_providers,
+)
+from .ratelimit import acquire_dispatch_slot
 from .utils import create_fax_message, ensure_fax_number, get_media_url, get_signature
 
 logger = logging.getLogger(__name__)
 
 
-class FaxFailedException(Exception):
-    msg: str
+def get_fax_pdf_cache_timeout():
+    return getattr(settings, "FROIDE_FAX_PDF_CACHE_TIMEOUT", 60 * 60)
 
-    def __init__(self, msg, *args, **kwargs):
-        self.msg = msg
-        super().__init__(*args, **kwargs)
 
-
-def convert_to_fax_bytes(original_message: FoiMessage) -> bytes:
-    pdf_generator = FaxMessagePDFGenerator(original_message)
-    return pdf_generator.get_pdf_bytes()
+def convert_to_fax_bytes(original_message: FoiMessage, consume=False) -> bytes:
+    """
+    Render the fax letter for a message, reusing a previously rendered
+    PDF with identical inputs (e.g. from a preview).
+    If `consume` is set, the cache entry is dropped after use.
+    """
+    cache_key = get_fax_pdf_cache_key(original_message)
+    pdf_bytes = cache.get(cache_key)
+    if pdf_bytes is None:
+        pdf_generator = FaxMessagePDFGenerator(original_message)
+        pdf_bytes = pdf_generator.get_pdf_bytes()
+        if not consume:
+            cache.set(cache_key, pdf_bytes, get_fax_pdf_cache_timeout())
+    elif consume:
+        cache.delete(cache_key)
+    return pdf_bytes
 
 
 def create_fax_attachment(fax_message):
@@ -40,7 +62,7 @@ def create_fax_attachment(fax_message):
         approved=False,
         can_approve=False,
     )
-    pdf_bytes = convert_to_fax_bytes(fax_message.original)
+    pdf_bytes = convert_to_fax_bytes(fax_message.original, consume=True)
     pdf_file = ContentFile(pdf_bytes)
     att.size = pdf_file.size
     att.file.save(att.name, pdf_file)
@@ -49,59 +71,150 @@ def create_fax_attachment(fax_message):
     return att
 
 
-def send_fax_message(fax_message):
+def get_fax_attachment(fax_message):
+    for att in fax_message.attachments:
+        if att.name == "fax.pdf":
+            return att
+    return None
+
+
+def render_fax_message(fax_message):
+    """
+    First pipeline stage: render and store the fax PDF.
+    Reuses an already stored PDF so the stage can be retried.
+    """
     if not fax_message.kind == MessageKind.FAX:
-        return
+        return None
 
-    create_fax_attachment(fax_message)
+    att = get_fax_attachment(fax_message)
+    if att is None:
+        att = create_fax_attachment(fax_message)
+    return att
+
+
+def dispatch_fax_message(fax_message, **kwargs):
+    """
+    Second pipeline stage: hand the stored PDF to the fax provider.
+    """
+    if not fax_message.kind == MessageKind.FAX:
+        return None
 
-    fax_message.send(notify=False)
+    fax_message.send(notify=False, **kwargs)
     return fax_message
 
 
-def send_fax_telnyx(
-    to,
-    from_,
-    media_url,
-    connection_id,
-    authorization="",
-    quality="high",
-):
-    """this sends a single message through the telnyx fax gateway
-    results / error to be handled by calling instance"""
-    data = {
-        "to": to,
-        "from": from_,
-        "media_url": media_url,
-        "connection_id": connection_id,  # this is a misnomer, app_id goes here
-        "quality": quality,  # choice of normal, high, very_high
-    }
-
-    headers = {
-        "Authorization": authorization,
-    }
-
-    response = requests.post(
-        "https://api.telnyx.com/v2/faxes", headers=headers, data=data
+def get_dispatch_delay(fax_message, connection, reserved=False):
+    fax_number = ensure_fax_number(fax_message.recipient_public_body)
+    if fax_number is None:
+        return 0, reserved
+    return acquire_dispatch_slot(fax_number, connection["app_id"], reserved=reserved)
+
+
+def send_fax(fax_number, media_url, connection=None):
+    """
+    Send through the first available provider, failing over to the next
+    one if the fax could not be handed over. Returns the provider and its
+    fax id. FaxOutcomeUnknown is raised right away, the fax may already
+    be on its way.
+    """
+    if connection is None:
+        connection = choose_fax_connection()
+    error = None
+    for provider in get_fax_providers():
+        breaker = get_circuit_breaker(provider.name)
+        if not breaker.allow_request():
+            continue
+        try:
+            fax_id = provider.send(fax_number, media_url, connection)
+        except ProviderUnavailable as e:
+            logger.warning("Fax provider %s unavailable: %s", provider.name, e.msg)
+            breaker.record_failure()
+            error = e
+            continue
+        except FaxOutcomeUnknown:
+            breaker.record_failure()
+            raise
+        except FaxFailedException:
+            # A rejected fax still proves the provider is reachable
+            breaker.record_success()
+            raise
+        breaker.record_success()
+        return provider, fax_id
+    if error is None:
+        error = ProviderUnavailable("All fax providers are unavailable")
+    raise error
+
+
+def fax_providers_available():
+    return any(
+        not get_circuit_breaker(provider.name).is_open()
+        for provider in get_fax_providers()
     )
 
-    try:
-        response.raise_for_status()
-    except Exception:
-        error_data = response.json()
-        logger.error("Fax sending failed %s", error_data)
-        raise FaxFailedException(response.text)
-    return response
-
-
-def send_fax(fax_number, media_url):
-    return send_fax_telnyx(
-        to=fax_number,
-        from_=settings.TELNYX_FROM_NUMBER,
-        media_url=media_url,
-        connection_id=settings.TELNYX_APP_ID,
-        authorization=f"Bearer {settings.TELNYX_API_KEY}",
-    )
+
+def claim_fax_dispatch(fax_message, claim=None, resend=False):
+    """
+    Atomically move a fax into sending so every attempt is posted only
+    once, even if its dispatch task runs twice. `claim` is the
+    `last_update` stamped by whoever already moved it into sending and
+    handed it to the queue. Returns the new claim or None if the fax is
+    sent or being sent already.
+    """
+    Delivery = DeliveryStatus.Delivery
+    now = timezone.now()
+    statuses = DeliveryStatus.objects.filter(message=fax_message)
+    ds = statuses.first()
+    transmissions = fax_message.fax_transmissions.all()
+    if ds is not None:
+        # Posted after the status was last changed: this attempt is done
+        transmissions = transmissions.filter(created__gt=ds.last_update)
+    if transmissions.exists():
+        return None
+
+    if claim is not None:
+        claimed = statuses.filter(status=Delivery.STATUS_SENDING, last_update=claim)
+    elif ds is None:
+        try:
+            with transaction.atomic():
+                DeliveryStatus.objects.create(
+                    message=fax_message, status=Delivery.STATUS_SENDING, last_update=now
+                )
+        except IntegrityError:
+            return None
+        return now
+    else:
+        allowed = ["", Delivery.STATUS_UNKNOWN, Delivery.STATUS_DEFERRED]
+        if resend:
+            allowed.append(Delivery.STATUS_FAILED)
+        claimed = statuses.filter(status__in=allowed)
+    if not claimed.update(status=Delivery.STATUS_SENDING, last_update=now):
+        return None
+    return now
+
+
+def defer_fax_message(
+    fax_message, delay=None, queued_at=None, slot_reserved=False, resend=False
+):
+    """
+    Park a fax for `delay` seconds or, without a delay, until a provider
+    is available again. `enqueue_deferred_faxes` hands it back to the
+    dispatch queue once it is due.
+    """
+    due = None
+    if delay is not None:
+        due = timezone.now() + timedelta(seconds=delay)
+    defaults = {"due": due, "slot_reserved": slot_reserved, "resend": resend}
+    if queued_at is not None:
+        defaults["queued_at"] = queued_at
+    FaxDeferral.objects.update_or_create(message=fax_message, defaults=defaults)
+    set_delivery_status(fax_message, DeliveryStatus.Delivery.STATUS_DEFERRED)
+
+
+def set_delivery_status(fax_message, status, **kwargs):
+    values = dict(status=status, last_update=timezone.now(), **kwargs)
+    updated = DeliveryStatus.objects.filter(message=fax_message).update(**values)
+    if not updated:
+        DeliveryStatus.objects.create(message=fax_message, **values)
 
 
 class FaxMessageHandler(MessageHandler):
@@ -114,31 +227,55 @@ class FaxMessageHandler(MessageHandler):
 
         att = fax_message.attachments[0]
 
-        media_url = get_media_url(att)
+        connection = get_fax_connection(kwargs.get("connection_id"))
+        if connection is None:
+            connection = choose_fax_connection()
+        media_url = get_media_url(att, app_id=connection["app_id"])
 
-        ds, created = DeliveryStatus.objects.update_or_create(
-            message=fax_message,
-            defaults=dict(
-                status=DeliveryStatus.Delivery.STATUS_SENDING,
-                last_update=timezone.now(),
-            ),
-        )
+        set_delivery_status(fax_message, DeliveryStatus.Delivery.STATUS_SENDING)
         try:
-            fax_response = send_fax(fax_number, media_url)
+            provider, fax_id = send_fax(fax_number, media_url, connection=connection)
         except FaxFailedException as e:
-            ds.status = DeliveryStatus.Delivery.STATUS_FAILED
-            ds.log = e.msg
-            ds.save()
+            set_delivery_status(
+                fax_message, DeliveryStatus.Delivery.STATUS_FAILED, log=e.msg
+            )
+            return
+        except ProviderUnavailable as e:
+            logger.warning("Deferring fax %s: %s", fax_message.pk, e.msg)
+            resend = kwargs.get("resend", False)
+            defer_fax_message(fax_message, resend=resend)
+            if resend:
+                # An outage is not a failed attempt, take back the resend's count
+                DeliveryStatus.objects.filter(
+                    message=fax_message, retry_count__gt=0
+                ).update(retry_count=F("retry_count") - 1)
+            return
+        except FaxOutcomeUnknown as e:
+            # Never sent again automatically, failed faxes can be resent
+            # by hand after checking with the provider
+            set_delivery_status(
+                fax_message,
+                DeliveryStatus.Delivery.STATUS_FAILED,
+                log="Outcome unknown: %s" % e.msg,
+            )
             return
 
-        fax_data = fax_response.json().get("data")
-        if fax_data:
-            fax_id = fax_data.get("id", "")
-
-        sent = fax_response.status_code == 202
-        # store fax.sid in message 'email_message_id' (misnomer)
+        # store fax id of latest attempt in 'email_message_id' (misnomer)
         FoiMessage.objects.filter(pk=fax_message.pk).update(
-            email_message_id=fax_id, sent=sent
+            email_message_id=fax_id, sent=True
+        )
+        queue_wait = kwargs.get("queue_wait")
+        if queue_wait is not None:
+            logger.info(
+                "Fax %s waited %.1fs in dispatch queue", fax_message.pk, queue_wait
+            )
+            queue_wait = timedelta(seconds=queue_wait)
+        FaxTransmission.objects.create(
+            message=fax_message,
+            provider=provider.name,
+            provider_id=fax_id,
+            connection_id=connection["app_id"],
+            queue_wait=queue_wait,
         )
 
     @classmethod
@@ -2,10 +2,12 @@ import base64
 from io import BytesIO
 
 from django import forms
+from django.core.files.base import ContentFile
 from django.utils import timezone
 from froide.foirequest.models import FoiRequest
 
-from .models import DATA_URL_PNG, Signature
+from .image_utils import optimize_signature_image
+from .models import DATA_URL_PNG, Signature, clear_signature_cache
 from .utils import get_signature, send_messages_of_request
 from .widgets import SignatureWidget
 
@@ -62,6 +64,8 @@ def save_signature_for_user(user, signature_bytes):
         sig = Signature.objects.get(user=user)
     except Signature.DoesNotExist:
         sig = Signature(user=user)
+    else:
+        sig.clear_cache()
 
     sig.remove_signature_file()
 
@@ -69,9 +73,12 @@ def save_signature_for_user(user, signature_bytes):
         sig.delete()
         sig = None
     elif signature_bytes is not None:
-        sig.signature.save("signature.png", signature_bytes)
+        signature_file = ContentFile(optimize_signature_image(signature_bytes.read()))
+        sig.signature.save("signature.png", signature_file)
         sig.timestamp = timezone.now()
         sig.save()
     else:
         sig = None
+    clear_signature_cache(user.id)
+    user._signature = sig
     return sig
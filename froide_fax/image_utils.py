@@ -0,0 +1,60 @@
+import logging
+from io import BytesIO
+
+from django.conf import settings
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Pixels lighter than this count as background when trimming
+WHITE_THRESHOLD = 250
+
+
+def get_signature_max_size():
+    return getattr(settings, "FROIDE_FAX_SIGNATURE_MAX_SIZE", (800, 300))
+
+
+def get_signature_mode():
+    # "1" for bilevel, "L" for grayscale
+    return getattr(settings, "FROIDE_FAX_SIGNATURE_MODE", "L")
+
+
+def flatten_image(image):
+    """Put transparent canvas drawings on white and convert to grayscale."""
+    if image.mode in ("RGBA", "LA", "P"):
+        image = image.convert("RGBA")
+        background = Image.new("RGBA", image.size, (255, 255, 255, 255))
+        image = Image.alpha_composite(background, image)
+    return image.convert("L")
+
+
+def trim_image(image):
+    mask = image.point(lambda p: 255 if p < WHITE_THRESHOLD else 0)
+    bbox = mask.getbbox()
+    if bbox is None:
+        return image
+    return image.crop(bbox)
+
+
+def optimize_signature_image(image_bytes: bytes) -> bytes:
+    """
+    Trim whitespace, reduce colors and dimensions of a signature PNG
+    for embedding in fax letters. Returns the input if it can't be read.
+    """
+    try:
+        image = Image.open(BytesIO(image_bytes))
+        image.load()
+    except (OSError, Image.DecompressionBombError) as e:
+        logger.warning("Could not optimize signature image: %s", e)
+        return image_bytes
+
+    image = trim_image(flatten_image(image))
+    image.thumbnail(get_signature_max_size(), Image.LANCZOS)
+    mode = get_signature_mode()
+    if mode == "1":
+        image = image.point(lambda p: 255 if p >= 128 else 0).convert("1")
+
+    output = BytesIO()
+    image.save(output, format="PNG", optimize=True)
+    return output.getvalue()
@@ -0,0 +1,65 @@
+import json
+import time
+import timeit
+
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from nacl.encoding import Base64Encoder
+from nacl.signing import SigningKey, VerifyKey
+
+from ...callbacks import InvalidCallback, get_verify_key, verify_telnyx_callback
+
+
+class Command(BaseCommand):
+    help = "Micro-benchmark fax webhook signature verification"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=10000)
+
+    def handle(self, *args, **options):
+        iterations = options["iterations"]
+        signing_key = SigningKey.generate()
+        public_key = signing_key.verify_key.encode(encoder=Base64Encoder).decode()
+        body = json.dumps(
+            {"data": {"id": "event", "payload": {"fax_id": "fax"}}}
+        ).encode("utf-8")
+        timestamp = str(int(time.time()))
+        signature = signing_key.sign(f"{timestamp}|".encode("utf-8") + body).signature
+        signature = Base64Encoder.encode(signature).decode()
+        stale_timestamp = str(int(time.time()) - 24 * 60 * 60)
+
+        def parse_key():
+            VerifyKey(public_key, encoder=Base64Encoder)
+
+        def cached_key():
+            get_verify_key(public_key)
+
+        def verify():
+            verify_telnyx_callback(body, timestamp, signature)
+
+        def reject(event_timestamp, event_signature):
+            def run():
+                try:
+                    verify_telnyx_callback(body, event_timestamp, event_signature)
+                except InvalidCallback:
+                    pass
+
+            return run
+
+        cases = [
+            ("parse key per call", parse_key),
+            ("cached key", cached_key),
+            ("verify valid callback", verify),
+            ("reject stale timestamp", reject(stale_timestamp, signature)),
+            ("reject missing header", reject(timestamp, None)),
+            ("reject bad base64", reject(timestamp, "not base64!")),
+        ]
+        with override_settings(TELNYX_PUBLIC_KEY=public_key):
+            for name, func in cases:
+                duration = timeit.timeit(func, number=iterations)
+                self.stdout.write(
+                    "{name}: {per_call:.2f} µs per call".format(
+                        name=name, per_call=duration / iterations * 1e6
+                    )
+                )
@@ -0,0 +1,79 @@
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from froide.publicbody.models import PublicBody
+
+from ...utils import normalize_fax_number
+
+
+class Command(BaseCommand):
+    help = "Normalize fax numbers of all public bodies to E.164"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=2000)
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Number of processes used for parsing numbers",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report what would change",
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options["chunk_size"]
+        dry_run = options["dry_run"]
+        executor = None
+        if options["workers"] > 1:
+            executor = ProcessPoolExecutor(max_workers=options["workers"])
+
+        counts = {"checked": 0, "normalized": 0, "cleared": 0, "invalid": 0}
+        try:
+            for chunk in self.get_chunks(chunk_size):
+                faxes = [pb.fax for pb in chunk]
+                if executor is not None:
+                    results = executor.map(
+                        normalize_fax_number,
+                        faxes,
+                        chunksize=max(len(faxes) // options["workers"], 1),
+                    )
+                else:
+                    results = map(normalize_fax_number, faxes)
+
+                changed = []
+                for publicbody, (fax_number, rewrite) in zip(chunk, results):
+                    counts["checked"] += 1
+                    if rewrite is None:
+                        if fax_number is None:
+                            counts["invalid"] += 1
+                        continue
+                    counts["normalized" if rewrite else "cleared"] += 1
+                    publicbody.fax = rewrite
+                    changed.append(publicbody)
+
+                if changed and not dry_run:
+                    PublicBody.objects.bulk_update(changed, ["fax"])
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        self.stdout.write(
+            "{prefix}Checked {checked}, normalized {normalized}, "
+            "cleared {cleared}, left {invalid} invalid".format(
+                prefix="[dry run] " if dry_run else "", **counts
+            )
+        )
+
+    def get_chunks(self, chunk_size):
+        queryset = PublicBody.objects.exclude(fax="").only("id", "fax").order_by("pk")
+        last_pk = 0
+        while True:
+            chunk = list(queryset.filter(pk__gt=last_pk)[:chunk_size])
+            if not chunk:
+                return
+            yield chunk
+            last_pk = chunk[-1].pk
@@ -0,0 +1,49 @@
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand
+
+from ...image_utils import optimize_signature_image
+from ...models import Signature
+
+
+class Command(BaseCommand):
+    help = "Trim and compress stored signature images"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report how much would be saved",
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options["dry_run"]
+        signatures = Signature.objects.exclude(signature="").exclude(signature=None)
+
+        count = 0
+        bytes_before = 0
+        bytes_after = 0
+        for sig in signatures.iterator():
+            signature_bytes = sig.get_signature_bytes()
+            if not signature_bytes:
+                continue
+            optimized = optimize_signature_image(signature_bytes)
+            if len(optimized) >= len(signature_bytes):
+                continue
+            count += 1
+            bytes_before += len(signature_bytes)
+            bytes_after += len(optimized)
+            if dry_run:
+                continue
+            sig.remove_signature_file()
+            sig.signature.save("signature.png", ContentFile(optimized), save=False)
+            sig.save(update_fields=["signature"])
+            sig.clear_cache()
+
+        self.stdout.write(
+            "{prefix}Optimized {count} signatures from {before} to {after} bytes".format(
+                prefix="[dry run] " if dry_run else "",
+                count=count,
+                before=bytes_before,
+                after=bytes_after,
+            )
+        )
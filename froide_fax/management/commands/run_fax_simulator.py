@@ -0,0 +1,75 @@
+from django.core.management.base import BaseCommand
+
+from ...simulator import FaxSimulator
+
+
+class Command(BaseCommand):
+    help = "Run a local stand-in for the Telnyx fax API"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "callback_url",
+            help="Absolute URL of the fax status callback, e.g. "
+            "http://localhost:8000/fax/fax-callback/",
+        )
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8010)
+        parser.add_argument(
+            "--private-key",
+            help="Base64 Ed25519 private key to keep the public key stable "
+            "across runs, a new one is generated by default",
+        )
+        parser.add_argument(
+            "--media-delay",
+            type=float,
+            default=1.0,
+            help="Seconds between status changes before sending",
+        )
+        parser.add_argument(
+            "--page-delay", type=float, default=5.0, help="Seconds to send a page"
+        )
+        parser.add_argument("--failure-rate", type=float, default=0.1)
+        parser.add_argument(
+            "--api-error-rate",
+            type=float,
+            default=0.0,
+            help="Share of POST requests answered with 503",
+        )
+        parser.add_argument("--duplicate-rate", type=float, default=0.05)
+        parser.add_argument("--reorder-rate", type=float, default=0.05)
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=8,
+            help="Threads fetching media and delivering webhooks",
+        )
+
+    def handle(self, *args, **options):
+        simulator = FaxSimulator(
+            options["callback_url"],
+            private_key=options["private_key"],
+            media_delay=options["media_delay"],
+            page_delay=options["page_delay"],
+            failure_rate=options["failure_rate"],
+            api_error_rate=options["api_error_rate"],
+            duplicate_rate=options["duplicate_rate"],
+            reorder_rate=options["reorder_rate"],
+            workers=options["workers"],
+        )
+        server = simulator.make_server(options["host"], options["port"])
+        self.stdout.write(
+            'TELNYX_API_BASE = "http://{host}:{port}/v2/"'.format(
+                host=options["host"], port=options["port"]
+            )
+        )
+        self.stdout.write('TELNYX_PUBLIC_KEY = "%s"' % simulator.public_key)
+        self.stdout.write("Private key: %s" % simulator.private_key)
+
+        simulator.start()
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            simulator.stop()
@@ -0,0 +1,278 @@
+import hashlib
+import re
+import time
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_etags, quote_etag
+
+from .client import FaxAPIClient
+
+MEDIA_DELIVERY_PROXY = "proxy"
+MEDIA_DELIVERY_ACCEL_REDIRECT = "x-accel-redirect"
+MEDIA_DELIVERY_SENDFILE = "x-sendfile"
+
+STREAM_CHUNK_SIZE = 64 * 1024
+MEDIA_METADATA_CACHE_PREFIX = "froide_fax:media:"
+MEDIA_METADATA_TIMEOUT = 7 * 24 * 60 * 60
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+# HashedFilenameStorage names files after the SHA-256 of their content
+HASHED_NAME_RE = re.compile(r"(?:^|/)([0-9a-f]{64})(?:\.\w+)?$")
+
+_media_client = None
+
+
+def get_media_client():
+    global _media_client
+    if _media_client is None:
+        _media_client = FaxAPIClient(max_retries=1, label="Fax media")
+    return _media_client
+
+
+def get_media_delivery_mode():
+    return getattr(settings, "FROIDE_FAX_MEDIA_DELIVERY", MEDIA_DELIVERY_PROXY)
+
+
+def get_local_path(field_file):
+    try:
+        return field_file.path
+    except (NotImplementedError, ValueError):
+        # Remote storage or no file
+        return None
+
+
+def get_offload_response(field_file, content_type):
+    """
+    Let the front-end server send a local file, so the worker does not
+    carry the bytes. Returns None if the file cannot be offloaded.
+    """
+    mode = get_media_delivery_mode()
+    if mode == MEDIA_DELIVERY_PROXY:
+        return None
+    path = get_local_path(field_file)
+    if path is None:
+        return None
+
+    response = HttpResponse(content_type=content_type)
+    if mode == MEDIA_DELIVERY_ACCEL_REDIRECT:
+        prefix = getattr(settings, "FROIDE_FAX_MEDIA_ACCEL_PREFIX", "/protected/")
+        response["X-Accel-Redirect"] = quote(prefix + field_file.name)
+    elif mode == MEDIA_DELIVERY_SENDFILE:
+        response["X-Sendfile"] = path
+    else:
+        raise ValueError("Unknown fax media delivery mode: %s" % mode)
+    return response
+
+
+def stream_upstream(upstream):
+    try:
+        yield from upstream.iter_content(STREAM_CHUNK_SIZE)
+    finally:
+        upstream.close()
+
+
+def get_proxy_response(url, headers=None):
+    upstream = get_media_client().get(url, stream=True, headers=headers)
+    response = StreamingHttpResponse(
+        stream_upstream(upstream),
+        content_type=upstream.headers.get("content-type"),
+        status=upstream.status_code,
+        reason=upstream.reason,
+    )
+    for header in ("Content-Length", "Content-Range"):
+        if header in upstream.headers:
+            response[header] = upstream.headers[header]
+    return response
+
+
+def get_media_metadata_cache_key(field_file):
+    name_hash = hashlib.sha256(field_file.name.encode("utf-8")).hexdigest()
+    return MEDIA_METADATA_CACHE_PREFIX + name_hash
+
+
+def get_last_modified(field_file):
+    try:
+        return int(field_file.storage.get_modified_time(field_file.name).timestamp())
+    except (NotImplementedError, OSError):
+        return int(time.time())
+
+
+def get_stored_last_modified(field_file):
+    """
+    Modification time of a file, asked from the storage only once so it
+    stays the same across requests.
+    """
+    cache_key = get_media_metadata_cache_key(field_file) + ":last_modified"
+    last_modified = cache.get(cache_key)
+    if last_modified is None:
+        last_modified = get_last_modified(field_file)
+        cache.set(cache_key, last_modified, MEDIA_METADATA_TIMEOUT)
+    return last_modified
+
+
+def store_media_metadata(field_file, content):
+    """
+    Remember content hash, size and modification time of a file so
+    conditional and range requests never need to touch the file again.
+    """
+    metadata = {
+        "etag": quote_etag(hashlib.sha256(content).hexdigest()),
+        "size": len(content),
+        "last_modified": get_last_modified(field_file),
+    }
+    cache.set(
+        get_media_metadata_cache_key(field_file), metadata, MEDIA_METADATA_TIMEOUT
+    )
+    return metadata
+
+
+def get_content_hash(field_file):
+    match = HASHED_NAME_RE.search(field_file.name)
+    if match is None:
+        return None
+    return match.group(1)
+
+
+def get_media_metadata(field_file, size=None, last_modified=None):
+    """
+    ETag, size and modification time of a stored file, taken from the
+    database: hashed file names carry the content hash and the size is
+    stored along with the file. Without a stored modification time the
+    storage is asked once. Only files without a hashed name are read
+    once and remembered in the cache.
+    """
+    if last_modified is not None:
+        last_modified = int(last_modified.timestamp())
+    content_hash = get_content_hash(field_file)
+    if content_hash is not None:
+        if size is None:
+            # Asks the storage, the file is not read
+            size = field_file.size
+        if last_modified is None:
+            last_modified = get_stored_last_modified(field_file)
+        return {
+            "etag": quote_etag(content_hash),
+            "size": size,
+            "last_modified": last_modified,
+        }
+
+    metadata = cache.get(get_media_metadata_cache_key(field_file))
+    if metadata is not None:
+        return metadata
+    field_file.open("rb")
+    try:
+        content = field_file.read()
+    finally:
+        field_file.close()
+    return store_media_metadata(field_file, content)
+
+
+def parse_range_header(range_header, size):
+    """
+    Parse a single byte range. Returns (start, end) inclusive, None for
+    a missing or unsupported (multi-)range and raises ValueError for
+    unsatisfiable ranges.
+    """
+    if not range_header:
+        return None
+    match = RANGE_RE.match(range_header.strip())
+    if match is None:
+        return None
+    start, end = match.groups()
+    if not start and not end:
+        return None
+    if not start:
+        # Suffix range: last n bytes
+        length = int(end)
+        if length == 0:
+            raise ValueError("Unsatisfiable range")
+        return max(size - length, 0), size - 1
+    start = int(start)
+    end = int(end) if end else size - 1
+    if start >= size or end < start:
+        raise ValueError("Unsatisfiable range")
+    return start, min(end, size - 1)
+
+
+def is_range_applicable(request, metadata):
+    if_range = request.headers.get("If-Range")
+    if not if_range:
+        return True
+    # Only strong ETags validate If-Range
+    return metadata["etag"] in parse_etags(if_range)
+
+
+def stream_file_range(field_file, start, length):
+    field_file.open("rb")
+    try:
+        field_file.seek(start)
+        while length > 0:
+            chunk = field_file.read(min(STREAM_CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        field_file.close()
+
+
+def get_file_response(request, field_file, metadata, content_type):
+    size = metadata["size"]
+    byte_range = None
+    if is_range_applicable(request, metadata):
+        try:
+            byte_range = parse_range_header(request.headers.get("Range"), size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response["Content-Range"] = "bytes */%d" % size
+            return response
+
+    if byte_range is None:
+        return FileResponse(field_file.open("rb"), content_type=content_type)
+
+    start, end = byte_range
+    length = end - start + 1
+    response = StreamingHttpResponse(
+        stream_file_range(field_file, start, length),
+        content_type=content_type,
+        status=206,
+    )
+    response["Content-Range"] = "bytes %d-%d/%d" % (start, end, size)
+    response["Content-Length"] = str(length)
+    return response
+
+
+def get_media_response(
+    request, field_file, content_type, url=None, size=None, last_modified=None
+):
+    """
+    Serve a stored file with strong ETag, Last-Modified and byte range
+    support. Local files are offloaded to the front-end server if
+    configured or read directly, remote files are proxied from `url`.
+    Pass the stored `size` and `last_modified` so the file is not read
+    just to describe it.
+    """
+    metadata = get_media_metadata(field_file, size=size, last_modified=last_modified)
+    response = get_conditional_response(
+        request, etag=metadata["etag"], last_modified=metadata["last_modified"]
+    )
+    if response is None:
+        response = get_offload_response(field_file, content_type)
+    if response is None:
+        if get_local_path(field_file) is not None or url is None:
+            response = get_file_response(request, field_file, metadata, content_type)
+        else:
+            headers = {}
+            if "Range" in request.headers and is_range_applicable(request, metadata):
+                headers["Range"] = request.headers["Range"]
+            response = get_proxy_response(url, headers=headers)
+
+    response["ETag"] = metadata["etag"]
+    if metadata["last_modified"] is not None:
+        response["Last-Modified"] = http_date(metadata["last_modified"])
+    response["Accept-Ranges"] = "bytes"
+    return response
@@ -0,0 +1,53 @@
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+import froide.helper.storage
+
+import froide_fax.models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("foirequest", "0001_initial"),
+        ("froide_fax", "0003_faxpermission"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FaxReport",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "thumbnail",
+                    models.ImageField(
+                        blank=True,
+                        null=True,
+                        storage=froide.helper.storage.HashedFilenameStorage(),
+                        upload_to=froide_fax.models.fax_report_path,
+                    ),
+                ),
+                ("timestamp", models.DateTimeField(default=django.utils.timezone.now)),
+                (
+                    "message",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="foirequest.foimessage",
+                        verbose_name="Message",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Fax report",
+                "verbose_name_plural": "Fax reports",
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+from django.db import migrations, models
+
+import froide.helper.storage
+
+import froide_fax.models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("froide_fax", "0004_faxreport"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="faxreport",
+            name="report",
+            field=models.FileField(
+                blank=True,
+                null=True,
+                storage=froide.helper.storage.HashedFilenameStorage(),
+                upload_to=froide_fax.models.fax_report_path,
+            ),
+        ),
+        migrations.AddField(
+            model_name="faxreport",
+            name="log_hash",
+            field=models.CharField(blank=True, max_length=64),
+        ),
+    ]
@@ -0,0 +1,37 @@
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("froide_fax", "0005_faxreport_report"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FaxCallbackEvent",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("payload", models.JSONField()),
+                ("timestamp", models.DateTimeField()),
+                ("received", models.DateTimeField(default=django.utils.timezone.now)),
+                (
+                    "processed",
+                    models.DateTimeField(blank=True, db_index=True, null=True),
+                ),
+            ],
+            options={
+                "verbose_name": "Fax callback event",
+                "verbose_name_plural": "Fax callback events",
+                "ordering": ("timestamp",),
+            },
+        ),
+    ]
@@ -0,0 +1,20 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("froide_fax", "0006_faxcallbackevent"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="faxcallbackevent",
+            name="event_id",
+            field=models.CharField(blank=True, max_length=255, null=True, unique=True),
+        ),
+        migrations.AlterField(
+            model_name="faxcallbackevent",
+            name="payload",
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,62 @@
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("foirequest", "0001_initial"),
+        ("froide_fax", "0007_faxcallbackevent_event_id"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FaxTransmission",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("provider_id", models.CharField(max_length=255, unique=True)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("queued", "queued"),
+                            ("media.processed", "media processed"),
+                            ("sending", "sending"),
+                            ("delivered", "delivered"),
+                            ("failed", "failed"),
+                        ],
+                        default="queued",
+                        max_length=32,
+                    ),
+                ),
+                ("page_count", models.PositiveIntegerField(blank=True, null=True)),
+                ("duration", models.PositiveIntegerField(blank=True, null=True)),
+                ("failure_reason", models.CharField(blank=True, max_length=255)),
+                ("created", models.DateTimeField(default=django.utils.timezone.now)),
+                ("updated", models.DateTimeField(default=django.utils.timezone.now)),
+                (
+                    "message",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="fax_transmissions",
+                        to="foirequest.foimessage",
+                        verbose_name="Message",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Fax transmission",
+                "verbose_name_plural": "Fax transmissions",
+                "ordering": ("-created",),
+                "get_latest_by": "created",
+            },
+        ),
+    ]
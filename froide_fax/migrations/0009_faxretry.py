@@ -0,0 +1,45 @@
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("foirequest", "0001_initial"),
+        ("froide_fax", "0008_faxtransmission"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FaxRetry",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("attempt", models.PositiveIntegerField(default=1)),
+                ("due", models.DateTimeField(db_index=True)),
+                ("created", models.DateTimeField(default=django.utils.timezone.now)),
+                ("enqueued", models.DateTimeField(blank=True, null=True)),
+                (
+                    "message",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="fax_retries",
+                        to="foirequest.foimessage",
+                        verbose_name="Message",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Fax retry",
+                "verbose_name_plural": "Fax retries",
+                "ordering": ("due",),
+            },
+        ),
+    ]
@@ -0,0 +1,15 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("froide_fax", "0009_faxretry"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="faxtransmission",
+            name="queue_wait",
+            field=models.DurationField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,22 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("froide_fax", "0010_faxtransmission_queue_wait"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="faxtransmission",
+            name="connection_id",
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddIndex(
+            model_name="faxtransmission",
+            index=models.Index(
+                fields=["connection_id", "status", "created"],
+                name="froide_fax__connect_4d6f2a_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,15 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("froide_fax", "0011_faxtransmission_connection_id"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="faxtransmission",
+            name="provider",
+            field=models.CharField(default="telnyx", max_length=50),
+        ),
+    ]
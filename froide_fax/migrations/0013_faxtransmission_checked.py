@@ -0,0 +1,22 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("froide_fax", "0012_faxtransmission_provider"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="faxtransmission",
+            name="checked",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="faxtransmission",
+            index=models.Index(
+                fields=["status", "updated"],
+                name="froide_fax__status_8c1e5b_idx",
+            ),
+        ),
+    ]
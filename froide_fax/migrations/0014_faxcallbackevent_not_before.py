@@ -0,0 +1,15 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("froide_fax", "0013_faxtransmission_checked"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="faxcallbackevent",
+            name="not_before",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
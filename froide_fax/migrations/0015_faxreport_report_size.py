@@ -0,0 +1,15 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("froide_fax", "0014_faxcallbackevent_not_before"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="faxreport",
+            name="report_size",
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,15 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("froide_fax", "0015_faxreport_report_size"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="faxcallbackevent",
+            name="provider",
+            field=models.CharField(default="telnyx", max_length=50),
+        ),
+    ]
@@ -0,0 +1,48 @@
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("foirequest", "0001_initial"),
+        ("froide_fax", "0016_faxcallbackevent_provider"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FaxDeferral",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("due", models.DateTimeField(blank=True, db_index=True, null=True)),
+                (
+                    "queued_at",
+                    models.DateTimeField(default=django.utils.timezone.now),
+                ),
+                ("slot_reserved", models.BooleanField(default=False)),
+                ("resend", models.BooleanField(default=False)),
+                (
+                    "message",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="fax_deferral",
+                        to="foirequest.foimessage",
+                        verbose_name="Message",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Fax deferral",
+                "verbose_name_plural": "Fax deferrals",
+                "ordering": ("due",),
+            },
+        ),
+    ]
@@ -2,6 +2,7 @@ import base64
 import os
 
 from django.conf import settings
+from django.core.cache import cache
 from django.db import models
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
@@ -9,12 +10,39 @@ from froide.helper.storage import HashedFilenameStorage
 
 DATA_URL_PNG = "data:image/png;base64,"
 
+SIGNATURE_CACHE_PREFIX = "froide_fax:signature:"
+SIGNATURE_CACHE_TIMEOUT = 24 * 60 * 60
+
+
+def get_signature_cache_key(user_id):
+    return "%s%s" % (SIGNATURE_CACHE_PREFIX, user_id)
+
+
+def get_signature_dataurl_cache_key(user_id, timestamp):
+    return "%sdataurl:%s:%s" % (
+        SIGNATURE_CACHE_PREFIX,
+        user_id,
+        timestamp.timestamp(),
+    )
+
+
+def clear_signature_cache(user_id, timestamp=None):
+    keys = [get_signature_cache_key(user_id)]
+    if timestamp is not None:
+        keys.append(get_signature_dataurl_cache_key(user_id, timestamp))
+    cache.delete_many(keys)
+
 
 def signature_path(instance=None, filename=None):
     path = ["signatures", filename]
     return os.path.join(*path)
 
 
+def fax_report_path(instance=None, filename=None):
+    path = ["fax-reports", filename]
+    return os.path.join(*path)
+
+
 FAX_PERMISSION_PART = "can_always_fax"
 FAX_PERMISSION = "froide_fax." + FAX_PERMISSION_PART
 
@@ -49,14 +77,23 @@ class Signature(models.Model):
             return
         self.signature.delete()
 
+    def clear_cache(self):
+        clear_signature_cache(self.user_id, self.timestamp)
+
     def get_signature_dataurl(self):
         if not self.signature:
             return None
+        cache_key = get_signature_dataurl_cache_key(self.user_id, self.timestamp)
+        dataurl = cache.get(cache_key)
+        if dataurl is not None:
+            return dataurl
         signature_bytes = self.get_signature_bytes()
         if not signature_bytes:
             return None
         b64_string = base64.b64encode(signature_bytes).decode("utf-8")
-        return DATA_URL_PNG + b64_string
+        dataurl = DATA_URL_PNG + b64_string
+        cache.set(cache_key, dataurl, SIGNATURE_CACHE_TIMEOUT)
+        return dataurl
 
     def get_signature_bytes(self):
         if not self.signature:
@@ -67,8 +104,181 @@ class Signature(models.Model):
             # File was deleted, set field to None
             self.signature = None
             self.save()
+            self.clear_cache()
             return None
         try:
             return self.signature.read()
         finally:
             self.signature.close()
+
+
+class FaxReport(models.Model):
+    """Precomputed parts of the transmission report of a fax message"""
+
+    message = models.OneToOneField(
+        "foirequest.FoiMessage", on_delete=models.CASCADE, verbose_name=_("Message")
+    )
+    thumbnail = models.ImageField(
+        null=True,
+        blank=True,
+        upload_to=fax_report_path,
+        storage=HashedFilenameStorage(),
+    )
+    report = models.FileField(
+        null=True,
+        blank=True,
+        upload_to=fax_report_path,
+        storage=HashedFilenameStorage(),
+    )
+    # Stored so the report can be served without touching the file
+    report_size = models.PositiveIntegerField(null=True, blank=True)
+    # Hash of the delivery status log the report was rendered from
+    log_hash = models.CharField(max_length=64, blank=True)
+    timestamp = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name = _("Fax report")
+        verbose_name_plural = _("Fax reports")
+
+    def __str__(self):
+        return str(self.message_id)
+
+    def get_thumbnail_bytes(self):
+        if not self.thumbnail:
+            return None
+        try:
+            self.thumbnail.open()
+        except IOError:
+            return None
+        try:
+            return self.thumbnail.read()
+        finally:
+            self.thumbnail.close()
+
+
+class FaxCallbackEvent(models.Model):
+    """Verified fax provider webhook waiting to be applied"""
+
+    # Provider event id, unique index used to drop duplicate deliveries
+    event_id = models.CharField(max_length=255, null=True, blank=True, unique=True)
+    # Name of the provider backend whose endpoint received the event
+    provider = models.CharField(max_length=50, default="telnyx")
+    payload = models.JSONField(null=True, blank=True)
+    timestamp = models.DateTimeField()
+    received = models.DateTimeField(default=timezone.now)
+    processed = models.DateTimeField(null=True, blank=True, db_index=True)
+    # Not applied before this time, e.g. while the fax id is still unknown
+    not_before = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ("timestamp",)
+        verbose_name = _("Fax callback event")
+        verbose_name_plural = _("Fax callback events")
+
+    def __str__(self):
+        return "%s (%s)" % (self.pk, self.timestamp)
+
+
+class FaxTransmission(models.Model):
+    """One attempt of sending a fax message through the provider"""
+
+    class Status(models.TextChoices):
+        QUEUED = "queued", _("queued")
+        MEDIA_PROCESSED = "media.processed", _("media processed")
+        SENDING = "sending", _("sending")
+        DELIVERED = "delivered", _("delivered")
+        FAILED = "failed", _("failed")
+
+    message = models.ForeignKey(
+        "foirequest.FoiMessage",
+        on_delete=models.CASCADE,
+        related_name="fax_transmissions",
+        verbose_name=_("Message"),
+    )
+    provider = models.CharField(max_length=50, default="telnyx")
+    provider_id = models.CharField(max_length=255, unique=True)
+    connection_id = models.CharField(max_length=255, blank=True)
+    status = models.CharField(
+        max_length=32, choices=Status.choices, default=Status.QUEUED
+    )
+    page_count = models.PositiveIntegerField(null=True, blank=True)
+    duration = models.PositiveIntegerField(null=True, blank=True)
+    failure_reason = models.CharField(max_length=255, blank=True)
+    # Time spent waiting for dispatch, including rate limit deferrals
+    queue_wait = models.DurationField(null=True, blank=True)
+    created = models.DateTimeField(default=timezone.now)
+    updated = models.DateTimeField(default=timezone.now)
+    # Last time the status was polled from the provider
+    checked = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ("-created",)
+        get_latest_by = "created"
+        indexes = [
+            models.Index(
+                fields=["connection_id", "status", "created"],
+                name="froide_fax__connect_4d6f2a_idx",
+            ),
+            models.Index(
+                fields=["status", "updated"],
+                name="froide_fax__status_8c1e5b_idx",
+            ),
+        ]
+        verbose_name = _("Fax transmission")
+        verbose_name_plural = _("Fax transmissions")
+
+    def __str__(self):
+        return "%s (%s)" % (self.provider_id, self.status)
+
+    @classmethod
+    def get_status(cls, provider_status):
+        if provider_status.startswith("sending"):
+            return cls.Status.SENDING
+        return cls.Status(provider_status)
+
+
+class FaxRetry(models.Model):
+    """Scheduled resend of a failed fax message"""
+
+    message = models.ForeignKey(
+        "foirequest.FoiMessage",
+        on_delete=models.CASCADE,
+        related_name="fax_retries",
+        verbose_name=_("Message"),
+    )
+    attempt = models.PositiveIntegerField(default=1)
+    due = models.DateTimeField(db_index=True)
+    created = models.DateTimeField(default=timezone.now)
+    enqueued = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ("due",)
+        verbose_name = _("Fax retry")
+        verbose_name_plural = _("Fax retries")
+
+    def __str__(self):
+        return "%s #%s (%s)" % (self.message_id, self.attempt, self.due)
+
+
+class FaxDeferral(models.Model):
+    """Fax waiting for a free dispatch slot or for a provider to recover"""
+
+    message = models.OneToOneField(
+        "foirequest.FoiMessage",
+        on_delete=models.CASCADE,
+        related_name="fax_deferral",
+        verbose_name=_("Message"),
+    )
+    # Without a due time the fax waits until a provider is available
+    due = models.DateTimeField(null=True, blank=True, db_index=True)
+    queued_at = models.DateTimeField(default=timezone.now)
+    slot_reserved = models.BooleanField(default=False)
+    resend = models.BooleanField(default=False)
+
+    class Meta:
+        ordering = ("due",)
+        verbose_name = _("Fax deferral")
+        verbose_name_plural = _("Fax deferrals")
+
+    def __str__(self):
+        return "%s (%s)" % (self.message_id, self.due)
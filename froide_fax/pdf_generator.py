@@ -1,13 +1,39 @@
 import base64
+import hashlib
 
-from filingcabinet.pdf_utils import PDFProcessor
-from filingcabinet.utils import get_local_file
+from django.conf import settings
 
 from froide.foirequest.pdf_generator import LetterPDFGenerator
 
+from .report import get_fax_thumbnail
 from .utils import get_signature, parse_fax_log
 
 
+FAX_PDF_CACHE_PREFIX = "froide_fax:pdf:"
+
+
+def get_fax_template_version():
+    return getattr(settings, "FROIDE_FAX_TEMPLATE_VERSION", "1")
+
+
+def get_fax_pdf_cache_key(message):
+    """
+    Content-addressed key for the rendered fax letter of a message.
+    Changes whenever the letter text, the signature or the template does.
+    """
+    signature = get_signature(message.sender_user)
+    parts = [
+        str(message.pk),
+        message.subject or "",
+        message.plaintext or "",
+        signature.timestamp.isoformat() if signature else "",
+        FaxMessagePDFGenerator.template_name,
+        str(get_fax_template_version()),
+    ]
+    digest = hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+    return FAX_PDF_CACHE_PREFIX + digest
+
+
 class FaxMessagePDFGenerator(LetterPDFGenerator):
     template_name = "froide_fax/message_letter.html"
 
@@ -27,14 +53,7 @@ class FaxReportPDFGenerator(LetterPDFGenerator):
     def get_context_data(self, obj):
         ctx = super().get_context_data(obj)
 
-        att = obj.attachments[0]
-        assert att.name == "fax.pdf"
-
-        with get_local_file(att.file.path) as path:
-            pdf = PDFProcessor(path)
-            for _, image in pdf.get_images([1], resolution=150):
-                image_bytes = image.make_blob("png")
-                break
+        image_bytes = get_fax_thumbnail(obj)
 
         ctx["page_image"] = base64.b64encode(image_bytes).decode("ascii")
         data = parse_fax_log(obj.deliverystatus)
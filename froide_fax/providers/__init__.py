@@ -0,0 +1,47 @@
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .base import (
+    FaxFailedException,
+    FaxOutcomeUnknown,
+    FaxProvider,
+    ProviderUnavailable,
+)
+
+__all__ = [
+    "FaxFailedException",
+    "FaxOutcomeUnknown",
+    "FaxProvider",
+    "ProviderUnavailable",
+    "get_fax_provider",
+    "get_fax_providers",
+]
+
+DEFAULT_PROVIDERS = ["froide_fax.providers.telnyx.TelnyxProvider"]
+
+_providers = None
+
+
+def get_fax_providers():
+    """
+    Configured provider backends in order of preference.
+    Later ones are only used when earlier ones are unavailable.
+    """
+    global _providers
+    if _providers is None:
+        paths = getattr(settings, "FROIDE_FAX_PROVIDERS", DEFAULT_PROVIDERS)
+        _providers = [import_string(path)() for path in paths]
+    return _providers
+
+
+def get_fax_provider(name):
+    for provider in get_fax_providers():
+        if provider.name == name:
+            return provider
+    return None
+
+
+def reset_fax_providers():
+    """Forget instantiated providers, e.g. after changing settings in tests."""
+    global _providers
+    _providers = None
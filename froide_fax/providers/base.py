@@ -0,0 +1,71 @@
+class FaxFailedException(Exception):
+    """The provider rejected the fax, retrying the same request won't help"""
+
+    msg: str
+
+    def __init__(self, msg, *args, **kwargs):
+        self.msg = msg
+        super().__init__(*args, **kwargs)
+
+
+class ProviderUnavailable(Exception):
+    """The provider could not be reached or had a server error"""
+
+    msg: str
+
+    def __init__(self, msg, *args, **kwargs):
+        self.msg = msg
+        super().__init__(msg, *args, **kwargs)
+
+
+class FaxOutcomeUnknown(Exception):
+    """
+    The request reached the provider but no answer came back, the fax
+    may or may not have been accepted. It must not be sent again
+    automatically.
+    """
+
+    msg: str
+
+    def __init__(self, msg, *args, **kwargs):
+        self.msg = msg
+        super().__init__(msg, *args, **kwargs)
+
+
+class FaxProvider:
+    """
+    Interface of a fax provider backend.
+
+    Events returned by `parse_event` are dicts as produced by
+    `froide_fax.callbacks.parse_fax_event`.
+    """
+
+    name = ""
+
+    def send(self, to, media_url, connection):
+        """
+        Send a fax and return the provider's id for it. Raises
+        FaxFailedException if the fax was rejected, ProviderUnavailable
+        if it could not be handed over and FaxOutcomeUnknown if that is
+        unclear.
+        """
+        raise NotImplementedError
+
+    def verify_callback(self, request):
+        """
+        Check authenticity of a status webhook and return the time it
+        was signed. Raises `froide_fax.callbacks.InvalidCallback`.
+        """
+        raise NotImplementedError
+
+    def parse_event(self, payload_json, event_timestamp):
+        """Turn a status webhook body into an event dict."""
+        raise NotImplementedError
+
+    def get_fax_status(self, provider_id):
+        """
+        Ask the provider for the current status of a fax. Returns an
+        event dict or None if the fax is unknown. Raises
+        ProviderUnavailable on transport or server errors.
+        """
+        raise NotImplementedError
@@ -0,0 +1,72 @@
+import hashlib
+import uuid
+
+from django.core.signing import BadSignature, Signer
+from django.utils import timezone
+
+from ..callbacks import InvalidCallback, parse_fax_event
+from .base import FaxFailedException, FaxProvider, ProviderUnavailable
+
+FAKE_CALLBACK_SALT = "froide_fax_fake_callback"
+
+
+def sign_fake_callback(body):
+    return Signer(salt=FAKE_CALLBACK_SALT).sign(hashlib.sha256(body).hexdigest())
+
+
+class FakeProvider(FaxProvider):
+    """
+    Offline provider for tests. Sent faxes are collected in `outbox`,
+    set an `event` on them to have it returned as their polled status.
+    Set `error` to ProviderUnavailable or FaxFailedException to simulate
+    failures.
+    """
+
+    name = "fake"
+
+    def __init__(self):
+        self.outbox = []
+        self.error = None
+
+    def send(self, to, media_url, connection):
+        if self.error is ProviderUnavailable:
+            raise ProviderUnavailable("fake provider unavailable")
+        if self.error is FaxFailedException:
+            raise FaxFailedException("fake provider rejected fax")
+        fax_id = "fake-%s" % uuid.uuid4()
+        self.outbox.append(
+            {"id": fax_id, "to": to, "media_url": media_url, "connection": connection}
+        )
+        return fax_id
+
+    def verify_callback(self, request):
+        signature = request.headers.get("X-Fake-Signature", "")
+        try:
+            value = Signer(salt=FAKE_CALLBACK_SALT).unsign(signature)
+        except BadSignature:
+            raise InvalidCallback("invalid signature", status=403)
+        if value != hashlib.sha256(request.body).hexdigest():
+            raise InvalidCallback("invalid signature", status=403)
+        return timezone.now()
+
+    def parse_event(self, payload_json, event_timestamp):
+        # Uses the same body format as Telnyx
+        return parse_fax_event(payload_json, event_timestamp)
+
+    def get_fax_status(self, provider_id):
+        if self.error is ProviderUnavailable:
+            raise ProviderUnavailable("fake provider unavailable")
+        for fax in self.outbox:
+            if fax["id"] == provider_id:
+                return fax.get("event")
+        return None
+
+
+class FailingFakeProvider(FakeProvider):
+    """Fake provider that is always unavailable, to exercise failover"""
+
+    name = "fake_failing"
+
+    def __init__(self):
+        super().__init__()
+        self.error = ProviderUnavailable
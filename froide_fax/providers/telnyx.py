@@ -0,0 +1,161 @@
+import logging
+
+from django.conf import settings
+from django.utils import timezone
+
+import requests
+from urllib3.exceptions import ProtocolError
+
+from ..callbacks import parse_fax_event, verify_telnyx_signature
+from ..client import get_fax_client
+from .base import (
+    FaxFailedException,
+    FaxOutcomeUnknown,
+    FaxProvider,
+    ProviderUnavailable,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def is_connect_error(error):
+    """
+    Whether a request failed before it reached the provider. After a read
+    timeout or a dropped connection the fax may have been accepted.
+    """
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    if not isinstance(error, requests.ConnectionError):
+        return False
+    reason = error.args[0] if error.args else None
+    reason = getattr(reason, "reason", reason)
+    return not isinstance(reason, ProtocolError)
+
+
+def send_fax_telnyx(
+    to,
+    from_,
+    media_url,
+    connection_id,
+    authorization="",
+    quality="high",
+):
+    """this sends a single message through the telnyx fax gateway
+    results / error to be handled by calling instance"""
+    data = {
+        "to": to,
+        "from": from_,
+        "media_url": media_url,
+        "connection_id": connection_id,  # this is a misnomer, app_id goes here
+        "quality": quality,  # choice of normal, high, very_high
+    }
+
+    headers = {
+        "Authorization": authorization,
+    }
+
+    try:
+        response = get_fax_client().post("faxes", headers=headers, data=data)
+    except (requests.ConnectionError, requests.Timeout) as e:
+        if is_connect_error(e):
+            raise ProviderUnavailable(str(e)) from e
+        logger.error("No answer from fax API for fax to %s: %s", to, e)
+        raise FaxOutcomeUnknown(str(e)) from e
+
+    if response.status_code in (502, 504):
+        # A gateway in front of the API gave up, the API may still have
+        # accepted the fax
+        logger.error(
+            "No answer from fax API for fax to %s: %s", to, response.status_code
+        )
+        raise FaxOutcomeUnknown(response.text)
+    if response.status_code >= 500 or response.status_code == 429:
+        logger.error("Fax API unavailable %s", response.status_code)
+        raise ProviderUnavailable(response.text)
+
+    try:
+        response.raise_for_status()
+    except requests.HTTPError:
+        # Error bodies are not always JSON, e.g. from a proxy in between
+        logger.error(
+            "Fax sending failed %s %s", response.status_code, response.text[:1000]
+        )
+        raise FaxFailedException(response.text)
+    return response
+
+
+class TelnyxProvider(FaxProvider):
+    name = "telnyx"
+
+    def send(self, to, media_url, connection):
+        response = send_fax_telnyx(
+            to=to,
+            from_=connection["from_number"],
+            media_url=media_url,
+            connection_id=connection["app_id"],
+            authorization=f"Bearer {settings.TELNYX_API_KEY}",
+        )
+        try:
+            fax_data = response.json().get("data")
+        except ValueError:
+            raise FaxFailedException(response.text)
+        if not fax_data or not fax_data.get("id"):
+            raise FaxFailedException(response.text)
+        return fax_data["id"]
+
+    def verify_callback(self, request):
+        return verify_telnyx_signature(request)
+
+    def parse_event(self, payload_json, event_timestamp):
+        return parse_fax_event(payload_json, event_timestamp)
+
+    def get_fax_status(self, provider_id):
+        headers = {"Authorization": f"Bearer {settings.TELNYX_API_KEY}"}
+        try:
+            response = get_fax_client().get(f"faxes/{provider_id}", headers=headers)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            raise ProviderUnavailable(str(e)) from e
+        if response.status_code == 404:
+            return None
+        if response.status_code >= 500 or response.status_code == 429:
+            raise ProviderUnavailable(response.text)
+        try:
+            response.raise_for_status()
+            fax = response.json()["data"]
+        except (requests.HTTPError, ValueError, KeyError, TypeError):
+            logger.error(
+                "Fax status lookup failed %s %s",
+                response.status_code,
+                response.text[:1000],
+            )
+            return None
+        return self.parse_fax_resource(fax)
+
+    def parse_fax_resource(self, fax):
+        """
+        Map a fax resource of the API onto the webhook body, so polled
+        and pushed statuses are parsed the same way.
+        """
+        payload_json = {
+            "data": {
+                "id": None,
+                "occurred_at": fax.get("updated_at") or fax.get("created_at"),
+                "payload": {
+                    "fax_id": fax.get("id"),
+                    "status": fax.get("status"),
+                    "from": fax.get("from"),
+                    "to": fax.get("to"),
+                    "page_count": fax.get("page_count"),
+                    "call_duration_secs": fax.get("call_duration_secs"),
+                    "failure_reason": fax.get("failure_reason"),
+                },
+            }
+        }
+        try:
+            return parse_fax_event(payload_json, timezone.now())
+        except ValueError:
+            # e.g. statuses that webhooks don't report
+            logger.info(
+                "Ignoring fax status %s of %s", fax.get("status"), fax.get("id")
+            )
+            return None
@@ -0,0 +1,116 @@
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+RATELIMIT_CACHE_PREFIX = "froide_fax:ratelimit:"
+LOCK_TIMEOUT = 5
+LOCK_ATTEMPTS = 50
+
+
+def get_destination_rate():
+    # (faxes, seconds): one fax every three minutes per fax machine
+    return getattr(settings, "FROIDE_FAX_DESTINATION_RATE", (1, 180))
+
+
+def get_connection_rate():
+    # (faxes, seconds) per provider connection
+    return getattr(settings, "FROIDE_FAX_CONNECTION_RATE", (10, 60))
+
+
+class TokenBucket:
+    """
+    Token bucket stored in the shared cache. A bucket holds up to
+    `capacity` tokens and refills at `capacity` tokens per `period`.
+    """
+
+    def __init__(self, name, capacity, period):
+        self.key = RATELIMIT_CACHE_PREFIX + name
+        self.capacity = capacity
+        self.rate = capacity / period
+
+    def lock(self):
+        lock_key = self.key + ":lock"
+        for _ in range(LOCK_ATTEMPTS):
+            if cache.add(lock_key, 1, LOCK_TIMEOUT):
+                return True
+            time.sleep(0.01)
+        return False
+
+    def unlock(self):
+        cache.delete(self.key + ":lock")
+
+    def update(self, change, reserve=False):
+        """
+        Add `change` tokens if the bucket allows it, or in any case when
+        reserving. Returns 0 on success or the seconds until the bucket
+        would allow it (reserving: until the reserved token is due).
+        """
+        if not self.lock():
+            # Heavy contention, try again a bit later
+            return 1.0
+        try:
+            now = time.time()
+            tokens, last = cache.get(self.key, (self.capacity, now))
+            tokens = min(self.capacity, tokens + (now - last) * self.rate)
+            wait = 0.0
+            if tokens + change >= 0 or reserve:
+                tokens = min(self.capacity, tokens + change)
+                if tokens < 0:
+                    # Reserved tokens are paid back by future refills
+                    wait = -tokens / self.rate
+            else:
+                wait = -(tokens + change) / self.rate
+            timeout = int((self.capacity - tokens) / self.rate) + 60
+            cache.set(self.key, (tokens, now), timeout)
+            return wait
+        finally:
+            self.unlock()
+
+    def acquire(self):
+        return self.update(-1)
+
+    def reserve(self):
+        return self.update(-1, reserve=True)
+
+
+def get_destination_bucket(fax_number):
+    destination_rate = get_destination_rate()
+    if not destination_rate:
+        return None
+    return TokenBucket("to:%s" % fax_number, *destination_rate)
+
+
+def get_connection_bucket(connection_id):
+    connection_rate = get_connection_rate()
+    if not connection_rate:
+        return None
+    return TokenBucket("connection:%s" % connection_id, *connection_rate)
+
+
+def acquire_dispatch_slot(fax_number, connection_id, reserved=False):
+    """
+    Take a token for the destination number and the connection. Returns
+    the seconds to defer the fax (0 to send it now) and whether the fax
+    holds its destination slot.
+
+    A fax over the destination limit reserves the next free slot, so
+    faxes waiting for the same number are spread out instead of all
+    waking up together. Pass `reserved=True` once the deferred fax is due.
+    """
+    destination = get_destination_bucket(fax_number)
+    if destination is not None and not reserved:
+        reserved = True
+        wait = destination.reserve()
+        if wait:
+            return wait, reserved
+    connection = get_connection_bucket(connection_id)
+    if connection is not None:
+        wait = connection.acquire()
+        if wait:
+            # Keep the destination slot, connections free up quickly
+            return wait, reserved
+    return 0, reserved
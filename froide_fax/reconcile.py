@@ -0,0 +1,99 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .callbacks import EVENT_APPLIED, process_fax_events
+from .circuit import get_circuit_breaker
+from .connections import IN_FLIGHT_STATUSES
+from .models import FaxTransmission
+from .providers import ProviderUnavailable, get_fax_provider
+
+logger = logging.getLogger(__name__)
+
+
+def get_reconcile_after():
+    # seconds without a status update before a fax is polled
+    return getattr(settings, "FROIDE_FAX_RECONCILE_AFTER", 10 * 60)
+
+
+def get_reconcile_max_age():
+    # give up polling faxes older than this many days
+    return getattr(settings, "FROIDE_FAX_RECONCILE_MAX_AGE", 7)
+
+
+def claim_stuck_transmissions(limit, now=None):
+    """
+    Claim in-flight transmissions that have not been updated for a while
+    and were not polled recently, oldest update first.
+    """
+    if now is None:
+        now = timezone.now()
+    cutoff = now - timedelta(seconds=get_reconcile_after())
+    with transaction.atomic():
+        transmissions = list(
+            FaxTransmission.objects.select_for_update(skip_locked=True)
+            .filter(
+                status__in=IN_FLIGHT_STATUSES,
+                updated__lt=cutoff,
+                created__gte=now - timedelta(days=get_reconcile_max_age()),
+            )
+            .filter(Q(checked=None) | Q(checked__lt=cutoff))
+            .order_by("updated")[:limit]
+        )
+        FaxTransmission.objects.filter(pk__in=[t.pk for t in transmissions]).update(
+            checked=now
+        )
+    return transmissions
+
+
+def poll_fax_status(transmission):
+    provider = get_fax_provider(transmission.provider)
+    if provider is None:
+        return None
+    breaker = get_circuit_breaker(provider.name)
+    if breaker.is_open():
+        return None
+    try:
+        event = provider.get_fax_status(transmission.provider_id)
+    except ProviderUnavailable as e:
+        logger.warning("Fax provider %s unavailable: %s", provider.name, e.msg)
+        breaker.record_failure()
+        return None
+    breaker.record_success()
+    return event
+
+
+def reconcile_fax_transmissions(limit=None):
+    """
+    Poll the provider for faxes whose status webhook seems lost and apply
+    the results like webhook events. Returns the outcomes by fax id.
+    """
+    if limit is None:
+        limit = getattr(settings, "FROIDE_FAX_RECONCILE_BATCH_SIZE", 50)
+    transmissions = claim_stuck_transmissions(limit)
+    if not transmissions:
+        return {}
+
+    # Requests share the client's connection pool, stay within its size
+    workers = getattr(settings, "FROIDE_FAX_RECONCILE_WORKERS", 4)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        events = [
+            event
+            for event in executor.map(poll_fax_status, transmissions)
+            if event is not None
+        ]
+    if not events:
+        return {}
+    with transaction.atomic():
+        outcomes = process_fax_events(events)
+    logger.info(
+        "Reconciled %d of %d stuck faxes",
+        sum(1 for outcome in outcomes.values() if outcome == EVENT_APPLIED),
+        len(transmissions),
+    )
+    return outcomes
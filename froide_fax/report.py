@@ -0,0 +1,77 @@
+import hashlib
+
+from django.core.files.base import ContentFile
+from django.utils import timezone
+
+from filingcabinet.pdf_utils import PDFProcessor
+from filingcabinet.utils import get_local_file
+
+from .models import FaxReport
+
+
+def get_fax_pdf_attachment(message):
+    att = message.attachments[0]
+    assert att.name == "fax.pdf"
+    return att
+
+
+def render_fax_thumbnail(message) -> bytes:
+    att = get_fax_pdf_attachment(message)
+    with get_local_file(att.file.path) as path:
+        pdf = PDFProcessor(path)
+        for _, image in pdf.get_images([1], resolution=150):
+            return image.make_blob("png")
+
+
+def create_fax_thumbnail(message) -> bytes:
+    image_bytes = render_fax_thumbnail(message)
+    report, _created = FaxReport.objects.get_or_create(message=message)
+    if report.thumbnail:
+        # A new rendering gets a new hashed name, don't leave the old file
+        report.thumbnail.delete(save=False)
+    report.thumbnail.save("thumbnail.png", ContentFile(image_bytes), save=False)
+    report.save(update_fields=["thumbnail"])
+    return image_bytes
+
+
+def get_fax_thumbnail(message) -> bytes:
+    """
+    Return the PNG of the first fax page, rendering and storing it
+    only if it was not precomputed.
+    """
+    try:
+        report = FaxReport.objects.get(message=message)
+    except FaxReport.DoesNotExist:
+        report = None
+    if report is not None:
+        image_bytes = report.get_thumbnail_bytes()
+        if image_bytes:
+            return image_bytes
+    return create_fax_thumbnail(message)
+
+
+def get_log_hash(deliverystatus):
+    return hashlib.sha256(deliverystatus.log.encode("utf-8")).hexdigest()
+
+
+def get_fax_report(message) -> FaxReport:
+    """
+    Return the stored transmission report of a fax message,
+    rendering it again only if the delivery status log changed.
+    """
+    from .pdf_generator import FaxReportPDFGenerator
+
+    report, _created = FaxReport.objects.get_or_create(message=message)
+    if report.report and report.log_hash == get_log_hash(message.deliverystatus):
+        return report
+
+    pdf_bytes = FaxReportPDFGenerator(message).get_pdf_bytes()
+    if report.report:
+        report.report.delete(save=False)
+    report.report.save("fax-report.pdf", ContentFile(pdf_bytes), save=False)
+    report.report_size = len(pdf_bytes)
+    report.timestamp = timezone.now()
+    # Rendering may have converted a legacy log
+    report.log_hash = get_log_hash(message.deliverystatus)
+    report.save(update_fields=["report", "report_size", "timestamp", "log_hash"])
+    return report
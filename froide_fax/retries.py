@@ -0,0 +1,188 @@
+import random
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from froide.foirequest.models import DeliveryStatus
+from froide.foirequest.models.message import MessageKind
+
+from .circuit import CIRCUIT_CLOSED, CIRCUIT_HALF_OPEN, get_circuit_breaker
+from .models import FaxDeferral, FaxRetry
+from .providers import get_fax_providers
+
+MAX_RETRIES = 3
+
+# Retry on the normal schedule
+FAILURE_RETRY = "retry"
+# The line is busy or the provider is at capacity, wait longer
+FAILURE_BACKOFF = "backoff"
+# Retrying can't help, give up right away
+FAILURE_FAIL = "fail"
+
+FAILURE_POLICIES = {
+    # Number does not exist or is no fax machine
+    "destination_invalid": FAILURE_FAIL,
+    "destination_not_in_countries_whitelist": FAILURE_FAIL,
+    "destination_not_in_service_plan": FAILURE_FAIL,
+    "receiver_decline": FAILURE_FAIL,
+    "receiver_incompatible_destination": FAILURE_FAIL,
+    "receiver_invalid_number_format": FAILURE_FAIL,
+    "receiver_unallocated_number": FAILURE_FAIL,
+    # Busy, unanswered or over capacity
+    "connection_channel_limit_exceeded": FAILURE_BACKOFF,
+    "destination_unreachable": FAILURE_BACKOFF,
+    "outbound_profile_channel_limit_exceeded": FAILURE_BACKOFF,
+    "receiver_no_answer": FAILURE_BACKOFF,
+    "receiver_no_response": FAILURE_BACKOFF,
+    "receiver_user_busy": FAILURE_BACKOFF,
+    "service_unavailable": FAILURE_BACKOFF,
+    "user_channel_limit_exceeded": FAILURE_BACKOFF,
+    # Transmission errors
+    "fax_signaling_error": FAILURE_RETRY,
+    "invalid_ecm_response_from_receiver": FAILURE_RETRY,
+    "receiver_call_dropped": FAILURE_RETRY,
+    "receiver_communication_error": FAILURE_RETRY,
+    "receiver_recovery_on_timer_expire": FAILURE_RETRY,
+}
+
+
+def get_failure_policy(failure_reason):
+    if not failure_reason:
+        return FAILURE_RETRY
+    policies = getattr(settings, "FROIDE_FAX_FAILURE_POLICIES", {})
+    if failure_reason in policies:
+        return policies[failure_reason]
+    return FAILURE_POLICIES.get(failure_reason, FAILURE_RETRY)
+
+
+def get_retry_delay(policy, retry_count):
+    if policy == FAILURE_BACKOFF:
+        # resend in intervals of 1, 4 and 16 hours
+        return 60 * 60 * 4**retry_count
+    # resend in intervals of 0.25, 1 and 4 hours
+    return 15 * 60 * 4**retry_count
+
+
+def schedule_fax_retry(message, delay, attempt=1):
+    """
+    Record a resend due after `delay` seconds,
+    unless one is already pending for the message.
+    """
+    pending = FaxRetry.objects.filter(message=message, enqueued=None)
+    if pending.exists():
+        return None
+    return FaxRetry.objects.create(
+        message=message,
+        attempt=attempt,
+        due=timezone.now() + timedelta(seconds=delay),
+    )
+
+
+def cancel_fax_retries(message):
+    return FaxRetry.objects.filter(message=message, enqueued=None).delete()[0]
+
+
+def enqueue_due_fax_retries(limit=None):
+    """
+    Claim due retries and hand them to the dispatch queue, spread out
+    by a random jitter. Returns the number of enqueued retries.
+    """
+    from .tasks import retry_fax_delivery
+
+    if limit is None:
+        limit = getattr(settings, "FROIDE_FAX_RETRY_BATCH_SIZE", 50)
+    jitter = getattr(settings, "FROIDE_FAX_RETRY_JITTER", 60)
+    now = timezone.now()
+
+    with transaction.atomic():
+        retries = list(
+            FaxRetry.objects.select_for_update(skip_locked=True)
+            .filter(enqueued=None, due__lte=now)
+            .order_by("due")[:limit]
+        )
+        for retry in retries:
+            transaction.on_commit(
+                partial(
+                    retry_fax_delivery.apply_async,
+                    (retry.message_id,),
+                    countdown=random.uniform(0, jitter),
+                )
+            )
+        FaxRetry.objects.filter(pk__in=[r.pk for r in retries]).update(enqueued=now)
+    return len(retries)
+
+
+def enqueue_deferred_faxes(limit=None):
+    """
+    Drain deferred faxes that are due: those waiting for a dispatch slot
+    once it is free, those parked during a provider outage once one
+    recovers. While providers are only probed a single fax is sent, once
+    one is closed again a batch spaced by `FROIDE_FAX_DRAIN_INTERVAL`
+    seconds. Returns the number of enqueued faxes.
+    """
+    from .tasks import dispatch_fax_message_task, retry_fax_delivery
+
+    states = {
+        get_circuit_breaker(provider.name).get_state()
+        for provider in get_fax_providers()
+    }
+    if CIRCUIT_CLOSED in states:
+        if limit is None:
+            limit = getattr(settings, "FROIDE_FAX_DRAIN_BATCH_SIZE", 20)
+    elif CIRCUIT_HALF_OPEN in states:
+        limit = 1
+    else:
+        return 0
+    interval = getattr(settings, "FROIDE_FAX_DRAIN_INTERVAL", 3)
+    now = timezone.now()
+
+    with transaction.atomic():
+        deferred = list(
+            DeliveryStatus.objects.select_for_update(skip_locked=True, of=("self",))
+            .filter(
+                Q(message__fax_deferral=None)
+                | Q(message__fax_deferral__due=None)
+                | Q(message__fax_deferral__due__lte=now),
+                status=DeliveryStatus.Delivery.STATUS_DEFERRED,
+                message__kind=MessageKind.FAX,
+            )
+            .order_by("last_update")[:limit]
+        )
+        message_ids = [d.message_id for d in deferred]
+        deferrals = {
+            d.message_id: d
+            for d in FaxDeferral.objects.filter(message_id__in=message_ids)
+        }
+        FaxDeferral.objects.filter(message_id__in=message_ids).delete()
+        # Claimed faxes leave the deferred state, later runs can't pick
+        # them up again. The dispatch task takes over the claim.
+        DeliveryStatus.objects.filter(
+            pk__in=[d.pk for d in deferred],
+            status=DeliveryStatus.Delivery.STATUS_DEFERRED,
+        ).update(status=DeliveryStatus.Delivery.STATUS_SENDING, last_update=now)
+        for i, delivery_status in enumerate(deferred):
+            task = dispatch_fax_message_task
+            # the fax waited at least since it was parked
+            kwargs = {
+                "queued_at": delivery_status.last_update.timestamp(),
+                "claim": now.isoformat(),
+            }
+            deferral = deferrals.get(delivery_status.message_id)
+            if deferral is not None:
+                if deferral.resend:
+                    task = retry_fax_delivery
+                kwargs["queued_at"] = deferral.queued_at.timestamp()
+                kwargs["slot_reserved"] = deferral.slot_reserved
+            transaction.on_commit(
+                partial(
+                    task.apply_async,
+                    (delivery_status.message_id,),
+                    kwargs,
+                    countdown=i * interval,
+                )
+            )
+    return len(deferred)
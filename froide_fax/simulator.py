@@ -0,0 +1,334 @@
+"""
+Local stand-in for the Telnyx fax API for load and integration tests.
+
+Accepts faxes on `POST /v2/faxes`, fetches their media, walks them through
+the Telnyx statuses with page-based delays and sends Ed25519-signed status
+webhooks, occasionally duplicated or out of order. Point `TELNYX_API_BASE`
+at it and set `TELNYX_PUBLIC_KEY` to its public key.
+"""
+
+import heapq
+import json
+import logging
+import random
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+import requests
+from nacl.encoding import Base64Encoder
+from nacl.signing import SigningKey
+
+logger = logging.getLogger(__name__)
+
+FAX_PATH = re.compile(r"^/v2/faxes/?$")
+FAX_DETAIL_PATH = re.compile(r"^/v2/faxes/(?P<fax_id>[^/]+)/?$")
+
+FAILURE_REASONS = (
+    "receiver_no_answer",
+    "receiver_user_busy",
+    "receiver_call_dropped",
+    "fax_signaling_error",
+    "destination_invalid",
+)
+
+PAGE_MARKER = re.compile(rb"/Type\s*/Page\b")
+
+
+def now_iso():
+    return datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+def count_pages(content):
+    return max(1, len(PAGE_MARKER.findall(content)))
+
+
+class FaxSimulator:
+    def __init__(
+        self,
+        callback_url,
+        private_key=None,
+        media_delay=1.0,
+        page_delay=5.0,
+        failure_rate=0.1,
+        api_error_rate=0.0,
+        duplicate_rate=0.05,
+        reorder_rate=0.05,
+        workers=8,
+    ):
+        self.callback_url = callback_url
+        if private_key:
+            self.signing_key = SigningKey(private_key, encoder=Base64Encoder)
+        else:
+            self.signing_key = SigningKey.generate()
+        self.media_delay = media_delay
+        self.page_delay = page_delay
+        self.failure_rate = failure_rate
+        self.api_error_rate = api_error_rate
+        self.duplicate_rate = duplicate_rate
+        self.reorder_rate = reorder_rate
+
+        self.faxes = {}
+        self.lock = threading.Lock()
+        self.session = requests.Session()
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.schedule_queue = []
+        self.schedule_condition = threading.Condition()
+        self.counter = 0
+        self.running = False
+
+    @property
+    def public_key(self):
+        return self.signing_key.verify_key.encode(encoder=Base64Encoder).decode()
+
+    @property
+    def private_key(self):
+        return self.signing_key.encode(encoder=Base64Encoder).decode()
+
+    # Scheduling
+
+    def start(self):
+        self.running = True
+        threading.Thread(target=self.run_scheduler, daemon=True).start()
+
+    def stop(self):
+        with self.schedule_condition:
+            self.running = False
+            self.schedule_condition.notify()
+        self.executor.shutdown(wait=False)
+
+    def schedule(self, delay, func, *args):
+        with self.schedule_condition:
+            self.counter += 1
+            heapq.heappush(
+                self.schedule_queue,
+                (time.monotonic() + delay, self.counter, func, args),
+            )
+            self.schedule_condition.notify()
+
+    def run_scheduler(self):
+        while True:
+            with self.schedule_condition:
+                if not self.running:
+                    return
+                if not self.schedule_queue:
+                    self.schedule_condition.wait()
+                    continue
+                due = self.schedule_queue[0][0]
+                wait = due - time.monotonic()
+                if wait > 0:
+                    self.schedule_condition.wait(wait)
+                    continue
+                _due, _counter, func, args = heapq.heappop(self.schedule_queue)
+            self.executor.submit(self.run_job, func, *args)
+
+    def run_job(self, func, *args):
+        try:
+            func(*args)
+        except Exception:
+            logger.exception("Simulator job %s failed", func.__name__)
+
+    # Fax API
+
+    def create_fax(self, data):
+        """Returns status code and response body for `POST /v2/faxes`"""
+        if random.random() < self.api_error_rate:
+            return 503, {"errors": [{"title": "Service Unavailable"}]}
+        missing = [key for key in ("to", "from", "media_url") if not data.get(key)]
+        if missing:
+            return 422, {
+                "errors": [
+                    {"title": "Missing parameter", "source": {"pointer": "/%s" % key}}
+                    for key in missing
+                ]
+            }
+        created_at = now_iso()
+        fax = {
+            "record_type": "fax",
+            "id": str(uuid.uuid4()),
+            "direction": "outbound",
+            "connection_id": data.get("connection_id", ""),
+            "to": data["to"],
+            "from": data["from"],
+            "media_url": data["media_url"],
+            "quality": data.get("quality", "high"),
+            "status": "queued",
+            "page_count": None,
+            "call_duration_secs": None,
+            "failure_reason": None,
+            "created_at": created_at,
+            "updated_at": created_at,
+        }
+        with self.lock:
+            self.faxes[fax["id"]] = fax
+        # Like the real API, this may still race the caller storing the id
+        self.emit(fax, "queued", delay=self.media_delay / 2)
+        self.schedule(self.media_delay, self.process_media, fax["id"])
+        return 202, {"data": dict(fax)}
+
+    def get_fax(self, fax_id):
+        """Returns status code and response body for `GET /v2/faxes/<id>`"""
+        with self.lock:
+            fax = self.faxes.get(fax_id)
+            if fax is None:
+                return 404, {"errors": [{"title": "Resource not found"}]}
+            return 200, {"data": dict(fax)}
+
+    # Fax lifecycle
+
+    def update_fax(self, fax_id, **kwargs):
+        with self.lock:
+            fax = self.faxes[fax_id]
+            fax.update(kwargs, updated_at=now_iso())
+            return dict(fax)
+
+    def process_media(self, fax_id):
+        with self.lock:
+            media_url = self.faxes[fax_id]["media_url"]
+        try:
+            response = self.session.get(media_url, timeout=30)
+            response.raise_for_status()
+        except requests.RequestException as e:
+            logger.warning("Fetching media of fax %s failed: %s", fax_id, e)
+            self.finish(fax_id, failure_reason="media_download_failed")
+            return
+        page_count = count_pages(response.content)
+        fax = self.update_fax(fax_id, status="media.processed", page_count=page_count)
+        self.emit(fax, "media.processed")
+        self.schedule(self.media_delay, self.start_sending, fax_id)
+
+    def start_sending(self, fax_id):
+        fax = self.update_fax(fax_id, status="sending")
+        self.emit(fax, "sending.started")
+        duration = fax["page_count"] * self.page_delay * random.uniform(0.8, 1.2)
+        failure_reason = None
+        if random.random() < self.failure_rate:
+            failure_reason = random.choice(FAILURE_REASONS)
+            # Failures tend to happen early in the call
+            duration *= random.random()
+        self.schedule(duration, self.finish, fax_id, failure_reason, duration)
+
+    def finish(self, fax_id, failure_reason=None, duration=0):
+        if failure_reason:
+            fax = self.update_fax(
+                fax_id,
+                status="failed",
+                failure_reason=failure_reason,
+                call_duration_secs=int(duration),
+            )
+            self.emit(fax, "failed")
+        else:
+            fax = self.update_fax(
+                fax_id, status="delivered", call_duration_secs=int(duration)
+            )
+            self.emit(fax, "delivered")
+
+    # Webhooks
+
+    def make_event(self, fax, event_type):
+        payload = {
+            key: fax[key]
+            for key in (
+                "connection_id",
+                "direction",
+                "to",
+                "from",
+                "media_url",
+                "status",
+                "page_count",
+                "call_duration_secs",
+                "failure_reason",
+            )
+        }
+        payload["fax_id"] = fax["id"]
+        return {
+            "data": {
+                "record_type": "event",
+                "event_type": "fax.%s" % event_type,
+                "id": str(uuid.uuid4()),
+                "occurred_at": fax["updated_at"],
+                "payload": payload,
+            },
+            "meta": {"attempt": 1, "delivered_to": self.callback_url},
+        }
+
+    def emit(self, fax, event_type, delay=0):
+        body = json.dumps(self.make_event(fax, event_type)).encode("utf-8")
+        if random.random() < self.reorder_rate:
+            # Arrives after the following event
+            delay += self.media_delay + self.page_delay
+        self.schedule(delay, self.deliver, body)
+        if random.random() < self.duplicate_rate:
+            self.schedule(delay + random.uniform(0, 5), self.deliver, body)
+
+    def sign(self, body, timestamp):
+        signed = self.signing_key.sign(f"{timestamp}|".encode("utf-8") + body)
+        return Base64Encoder.encode(signed.signature).decode()
+
+    def deliver(self, body):
+        timestamp = str(int(time.time()))
+        headers = {
+            "Content-Type": "application/json",
+            "Telnyx-Timestamp": timestamp,
+            "Telnyx-Signature-Ed25519": self.sign(body, timestamp),
+        }
+        try:
+            response = self.session.post(
+                self.callback_url, data=body, headers=headers, timeout=10
+            )
+        except requests.RequestException as e:
+            logger.warning("Webhook delivery failed: %s", e)
+            return
+        if response.status_code >= 300:
+            logger.warning("Webhook answered with %s", response.status_code)
+
+    # HTTP server
+
+    def make_server(self, host, port):
+        handler = type("Handler", (SimulatorRequestHandler,), {"simulator": self})
+        return ThreadingHTTPServer((host, port), handler)
+
+
+class SimulatorRequestHandler(BaseHTTPRequestHandler):
+    simulator = None
+
+    def send_json(self, status, data):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_data(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length)
+        if self.headers.get("Content-Type", "").startswith("application/json"):
+            return json.loads(body or b"{}")
+        return {key: values[0] for key, values in parse_qs(body.decode()).items()}
+
+    def do_POST(self):
+        if not FAX_PATH.match(self.path):
+            self.send_json(404, {"errors": [{"title": "Not found"}]})
+            return
+        try:
+            data = self.read_data()
+        except ValueError:
+            self.send_json(400, {"errors": [{"title": "Invalid body"}]})
+            return
+        self.send_json(*self.simulator.create_fax(data))
+
+    def do_GET(self):
+        match = FAX_DETAIL_PATH.match(self.path)
+        if match is None:
+            self.send_json(404, {"errors": [{"title": "Not found"}]})
+            return
+        self.send_json(*self.simulator.get_fax(match.group("fax_id")))
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
@@ -1,10 +1,17 @@
+import logging
+import time
+from datetime import datetime, timezone
+
 from django.conf import settings
 from django.utils import translation
+from django.utils.dateparse import parse_datetime
 
 from froide.celery import app as celery_app
 from froide.foirequest.models import FoiMessage
 
-from .utils import create_fax_message
+from .utils import apply_fax_number_updates, create_fax_message
+
+logger = logging.getLogger(__name__)
 
 
 @celery_app.task
@@ -19,9 +26,29 @@ def send_message_as_fax_task(message_id):
     create_fax_message(message)
 
 
+# Rendering is CPU-bound, dispatching is I/O-bound: both stages get their
+# own queue so workers can be scaled independently, e.g.
+# `celery worker -Q fax_render -c 2` and `celery worker -Q fax_dispatch -c 16`
+FAX_RENDER_QUEUE = getattr(settings, "FROIDE_FAX_RENDER_QUEUE", "fax_render")
+FAX_DISPATCH_QUEUE = getattr(settings, "FROIDE_FAX_DISPATCH_QUEUE", "fax_dispatch")
+
+
 @celery_app.task
 def send_fax_message_task(message_id):
-    from .fax import send_fax_message
+    # Kept for tasks queued before the pipeline split
+    render_fax_message_task.delay(message_id)
+
+
+@celery_app.task(
+    queue=FAX_RENDER_QUEUE,
+    rate_limit=getattr(settings, "FROIDE_FAX_RENDER_RATE_LIMIT", None),
+    autoretry_for=(IOError,),
+    retry_backoff=30,
+    max_retries=3,
+    acks_late=True,
+)
+def render_fax_message_task(message_id):
+    from .fax import render_fax_message
 
     translation.activate(settings.LANGUAGE_CODE)
 
@@ -30,24 +57,130 @@ def send_fax_message_task(message_id):
     except FoiMessage.DoesNotExist:
         return
 
-    send_fax_message(message)
+    if render_fax_message(message) is None:
+        return
 
+    dispatch_fax_message_task.delay(message_id, queued_at=time.time())
 
-@celery_app.task
-def retry_fax_delivery(message_id):
+
+def prepare_dispatch(message, queued_at, slot_reserved=False, claim=None, resend=False):
+    """
+    Claim the fax and choose a connection for it. Park the fax and return
+    None until its next free slot if the recipient or the connection is at
+    its rate limit, or until a provider recovers if none is available.
+    Deferring does not count as a retry. A deferred fax keeps the
+    destination slot it reserved. Returns None without doing anything if
+    the fax is already underway.
+    """
+    from .connections import choose_fax_connection
+    from .fax import (
+        claim_fax_dispatch,
+        defer_fax_message,
+        fax_providers_available,
+        get_dispatch_delay,
+    )
+
+    if claim is not None:
+        claim = parse_datetime(claim)
+    claim = claim_fax_dispatch(message, claim=claim, resend=resend)
+    if claim is None:
+        logger.info("Fax %s is already being sent, skipping", message.pk)
+        return None
+
+    deferral = {
+        "queued_at": datetime.fromtimestamp(queued_at, tz=timezone.utc),
+        "resend": resend,
+    }
+    if not fax_providers_available():
+        logger.warning(
+            "Deferring fax %s: all fax providers are unavailable", message.pk
+        )
+        defer_fax_message(message, slot_reserved=slot_reserved, **deferral)
+        return None
+
+    connection = choose_fax_connection()
+    delay, slot_reserved = get_dispatch_delay(
+        message, connection, reserved=slot_reserved
+    )
+    if not delay:
+        return connection
+    logger.info(
+        "Deferring fax %s by %.0fs, waiting for %.0fs",
+        message.pk,
+        delay,
+        time.time() - queued_at,
+    )
+    defer_fax_message(message, delay=delay, slot_reserved=slot_reserved, **deferral)
+    return None
+
+
+@celery_app.task(
+    queue=FAX_DISPATCH_QUEUE,
+    rate_limit=getattr(settings, "FROIDE_FAX_DISPATCH_RATE_LIMIT", None),
+)
+def dispatch_fax_message_task(
+    message_id, queued_at=None, slot_reserved=False, claim=None
+):
+    from .fax import dispatch_fax_message
+
+    translation.activate(settings.LANGUAGE_CODE)
+
+    if queued_at is None:
+        queued_at = time.time()
+
+    try:
+        message = FoiMessage.objects.get(pk=message_id)
+    except FoiMessage.DoesNotExist:
+        return
+
+    connection = prepare_dispatch(
+        message,
+        queued_at,
+        slot_reserved=slot_reserved,
+        claim=claim,
+    )
+    if connection is None:
+        return
+
+    dispatch_fax_message(
+        message,
+        queue_wait=time.time() - queued_at,
+        connection_id=connection["app_id"],
+    )
+
+
+@celery_app.task(queue=FAX_DISPATCH_QUEUE)
+def retry_fax_delivery(message_id, queued_at=None, slot_reserved=False, claim=None):
     translation.activate(settings.LANGUAGE_CODE)
 
+    if queued_at is None:
+        queued_at = time.time()
+
     try:
         message = FoiMessage.objects.get(pk=message_id)
     except FoiMessage.DoesNotExist:
         return
 
-    message.resend()
+    connection = prepare_dispatch(
+        message,
+        queued_at,
+        slot_reserved=slot_reserved,
+        claim=claim,
+        resend=True,
+    )
+    if connection is None:
+        return
+
+    message.resend(
+        queue_wait=time.time() - queued_at,
+        connection_id=connection["app_id"],
+        resend=True,
+    )
 
 
 @celery_app.task
 def send_test_fax():
-    from .fax import send_fax_telnyx
+    from .providers.telnyx import send_fax_telnyx
 
     """
     send test faxes regularly, possibly with a distinct APP_ID, to gather receipts and ensure fax sending works as intended
@@ -68,3 +201,62 @@ def send_test_fax():
 
     assert api_answer.status_code == 202
     # further process results here
+
+
+@celery_app.task
+def update_fax_numbers_task(updates):
+    apply_fax_number_updates(updates)
+
+
+@celery_app.task(queue=FAX_RENDER_QUEUE)
+def create_fax_thumbnail_task(message_id):
+    from .report import create_fax_thumbnail
+
+    try:
+        message = FoiMessage.objects.get(pk=message_id)
+    except FoiMessage.DoesNotExist:
+        return
+
+    create_fax_thumbnail(message)
+
+
+@celery_app.task
+def process_fax_callback_events_task():
+    from .callbacks import process_queued_fax_events
+
+    translation.activate(settings.LANGUAGE_CODE)
+
+    # Drain a bounded number of batches per run
+    for _ in range(10):
+        if not process_queued_fax_events():
+            break
+
+
+@celery_app.task
+def prune_fax_callback_events_task():
+    from .callbacks import prune_fax_callback_events
+
+    prune_fax_callback_events()
+
+
+@celery_app.task
+def enqueue_due_fax_retries_task():
+    from .retries import enqueue_due_fax_retries
+
+    enqueue_due_fax_retries()
+
+
+@celery_app.task
+def reconcile_fax_transmissions_task():
+    from .reconcile import reconcile_fax_transmissions
+
+    translation.activate(settings.LANGUAGE_CODE)
+
+    reconcile_fax_transmissions()
+
+
+@celery_app.task
+def enqueue_deferred_faxes_task():
+    from .retries import enqueue_deferred_faxes
+
+    enqueue_deferred_faxes()
@@ -19,6 +19,11 @@ urlpatterns = [
     path("preview/<int:message_id>/", preview_fax, name="froide_fax-preview_fax"),
     path("report/<int:message_id>/", pdf_report, name="froide_fax-report"),
     path("fax-callback/", fax_status_callback, name="froide_fax-status_callback"),
+    path(
+        "fax-callback/<slug:provider>/",
+        fax_status_callback,
+        name="froide_fax-provider_status_callback",
+    ),
     re_path(
         r"^fax-media/(?P<signed>[^/]+)/$", fax_media_url, name="froide_fax-media_url"
     ),
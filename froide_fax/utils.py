@@ -1,12 +1,14 @@
 import json
 import re
+import threading
 from datetime import datetime, timedelta
 from datetime import timezone as tz
-from functools import partial
+from functools import lru_cache, partial
 from typing import List
 
 import phonenumbers
 from django.conf import settings
+from django.core.cache import cache
 from django.core.serializers.json import DjangoJSONEncoder
 from django.core.signing import BadSignature, Signer
 from django.db import transaction
@@ -15,39 +17,112 @@ from django.utils import timezone
 from froide.foirequest.models import DeliveryStatus, FoiMessage, FoiRequest
 from froide.foirequest.models.message import MessageKind
 
-from .models import Signature
+from .connections import get_connection_ids
+from .models import SIGNATURE_CACHE_TIMEOUT, Signature, get_signature_cache_key
 
 
-def ensure_fax_number(publicbody):
-    if not publicbody.fax:
-        return None
+@lru_cache(maxsize=4096)
+def normalize_fax_number(fax):
+    """
+    Parse a raw fax number without side effects.
+    Returns a tuple of the E.164 number (or None if it can't be faxed)
+    and the value the stored number should be rewritten to (or None).
+    """
+    if not fax:
+        return None, None
     try:
-        number = phonenumbers.parse(publicbody.fax, "DE")
+        number = phonenumbers.parse(fax, "DE")
     except phonenumbers.phonenumberutil.NumberParseException:
-        return None
+        return None, None
     if not phonenumbers.is_possible_number(number):
-        publicbody.fax = ""
-        publicbody.save()
-        return None
+        return None, ""
     if not phonenumbers.is_valid_number(number):
-        return None
+        return None, None
     fax_number = phonenumbers.format_number(number, phonenumbers.PhoneNumberFormat.E164)
-    if fax_number != publicbody.fax:
-        publicbody.fax = fax_number
-        publicbody.save()
+    if fax_number != fax:
+        return fax_number, fax_number
+    return fax_number, None
+
+
+_pending_fax_updates = {}
+_pending_fax_updates_lock = threading.Lock()
+
+
+def ensure_fax_number(publicbody):
+    """
+    Return the normalized fax number of a public body.
+    Never writes: needed rewrites are collected and applied later in bulk
+    by `flush_fax_number_updates`.
+    """
+    fax_number, rewrite = normalize_fax_number(publicbody.fax)
+    if rewrite is not None and publicbody.pk is not None:
+        with _pending_fax_updates_lock:
+            _pending_fax_updates[publicbody.pk] = (publicbody.fax, rewrite)
     return fax_number
 
 
+def flush_fax_number_updates(**kwargs):
+    """
+    Hand collected fax number rewrites to a background task.
+    Connected to `request_finished` and celery's `task_postrun`.
+    """
+    from .tasks import update_fax_numbers_task
+
+    with _pending_fax_updates_lock:
+        if not _pending_fax_updates:
+            return
+        updates = list(_pending_fax_updates.items())
+        _pending_fax_updates.clear()
+    update_fax_numbers_task.delay(updates)
+
+
+def apply_fax_number_updates(updates):
+    """
+    Bulk write fax number rewrites, skipping public bodies whose
+    number has changed since the rewrite was computed.
+    """
+    from froide.publicbody.models import PublicBody
+
+    updates = dict((pk, (old, new)) for pk, (old, new) in updates)
+    publicbodies = PublicBody.objects.filter(pk__in=updates.keys()).only("id", "fax")
+    changed = []
+    for publicbody in publicbodies:
+        old, new = updates[publicbody.pk]
+        if publicbody.fax != old:
+            continue
+        publicbody.fax = new
+        changed.append(publicbody)
+    PublicBody.objects.bulk_update(changed, ["fax"])
+    return len(changed)
+
+
 def get_signature(user):
     if user is None:
         return None
     if hasattr(user, "_signature"):
         return user._signature
-    try:
-        signature = Signature.objects.get(user=user)
-    except Signature.DoesNotExist:
-        user._signature = None
-        return None
+
+    cache_key = get_signature_cache_key(user.id)
+    data = cache.get(cache_key)
+    if data is None:
+        try:
+            signature = Signature.objects.get(user=user)
+        except Signature.DoesNotExist:
+            signature = None
+        if signature is None:
+            data = {}
+        else:
+            data = {
+                "id": signature.id,
+                "signature": signature.signature.name,
+                "timestamp": signature.timestamp,
+            }
+        cache.set(cache_key, data, SIGNATURE_CACHE_TIMEOUT)
+    elif data:
+        signature = Signature(user=user, **data)
+    else:
+        signature = None
+
     user._signature = signature
     return signature
 
@@ -56,12 +131,12 @@ FAX_MEDIA_SALT = "fax_media_url"
 FAX_CALLBACK_SALT = "fax_callback_url"
 
 
-def get_media_url(att):
-    return get_signed_media_url(att)
+def get_media_url(att, app_id=None):
+    return get_signed_media_url(att, app_id=app_id)
 
 
-def get_signed_media_url(att):
-    attachment_signature = sign_obj_id(att.pk, salt=FAX_MEDIA_SALT)
+def get_signed_media_url(att, app_id=None):
+    attachment_signature = sign_obj_id(att.pk, salt=FAX_MEDIA_SALT, app_id=app_id)
     return settings.SITE_URL + reverse(
         "froide_fax-media_url", kwargs={"signed": attachment_signature}
     )
@@ -74,9 +149,11 @@ def get_status_callback_url(message):
     )
 
 
-def sign_obj_id(obj_id, salt=None):
+def sign_obj_id(obj_id, salt=None, app_id=None):
+    if app_id is None:
+        app_id = settings.TELNYX_APP_ID
     signer = Signer(salt=salt)
-    value = signer.sign("%s@%s" % (obj_id, settings.TELNYX_APP_ID))
+    value = signer.sign("%s@%s" % (obj_id, app_id))
     return value
 
 
@@ -97,7 +174,7 @@ def unsign_obj_id(signature, salt=None):
     parts = original.split("@", 1)
     if len(parts) != 2:
         return None
-    if parts[1] != settings.TELNYX_APP_ID:
+    if parts[1] not in get_connection_ids():
         return None
     return int(parts[0])
 
@@ -120,6 +197,82 @@ def is_faxing_enabled_on_request(foirequest: FoiRequest):
     ) or foirequest.has_been_refused()
 
 
+class FaxabilityEvaluator:
+    """
+    Decides which messages of a request can be faxed.
+    Facts shared by all messages of the request are computed once,
+    so that checking every message of a request is linear.
+    """
+
+    def __init__(self, foirequest: FoiRequest):
+        self.foirequest = foirequest
+        self.messages = foirequest.messages
+        self.faxing_enabled = is_faxing_enabled_on_request(foirequest)
+        self.already_faxed = set(
+            [
+                m.original_id
+                for m in self.messages
+                if not m.is_response and m.kind == MessageKind.FAX
+            ]
+        )
+        self.fax_numbers = {}
+
+    def get_fax_number(self, publicbody):
+        if publicbody.pk not in self.fax_numbers:
+            self.fax_numbers[publicbody.pk] = ensure_fax_number(publicbody)
+        return self.fax_numbers[publicbody.pk]
+
+    def mark_faxed(self, message: FoiMessage):
+        self.already_faxed.add(message.id)
+
+    def can_be_faxed(
+        self,
+        message: FoiMessage,
+        ignore_time: bool = False,
+        ignore_signature: bool = False,
+        ignore_law: bool = False,
+    ) -> bool:
+        if message is None:
+            return False
+        if not message.is_email:
+            return False
+        if message.is_response:
+            return False
+
+        if not ignore_law and not self.faxing_enabled:
+            return False
+
+        if not message.recipient_public_body:
+            return False
+
+        fax_number = self.get_fax_number(message.recipient_public_body)
+        if fax_number is None:
+            return False
+
+        # get_signature is memoized on the user object
+        sig = get_signature(self.foirequest.user)
+        if not ignore_signature and not sig:
+            return False
+
+        not_too_long_ago = timezone.now() - timedelta(hours=36)
+        if not ignore_time and message.timestamp < not_too_long_ago:
+            return False
+
+        if message.id in self.already_faxed:
+            return False
+
+        return True
+
+
+def get_fax_evaluator(foirequest: FoiRequest) -> FaxabilityEvaluator:
+    evaluator = getattr(foirequest, "_fax_evaluator", None)
+    # Rebuild when the request's message list has been reloaded
+    if evaluator is None or evaluator.messages is not foirequest.messages:
+        evaluator = FaxabilityEvaluator(foirequest)
+        foirequest._fax_evaluator = evaluator
+    return evaluator
+
+
 def message_can_be_faxed(
     message: FoiMessage,
     ignore_time: bool = False,
@@ -128,47 +281,19 @@ def message_can_be_faxed(
 ) -> bool:
     if message is None:
         return False
-    if not message.is_email:
-        return False
-    if message.is_response:
-        return False
-
-    foirequest = message.request
-    if not ignore_law and not is_faxing_enabled_on_request(foirequest):
-        return False
-
-    if not message.recipient_public_body:
-        return False
-
-    fax_number = ensure_fax_number(message.recipient_public_body)
-    if fax_number is None:
-        return False
-
-    sig = get_signature(foirequest.user)
-    if not ignore_signature and not sig:
-        return False
-
-    not_too_long_ago = timezone.now() - timedelta(hours=36)
-    if not ignore_time and message.timestamp < not_too_long_ago:
-        return False
-
-    already_faxed = set(
-        [
-            m.original_id
-            for m in foirequest.messages
-            if not m.is_response and m.kind == MessageKind.FAX
-        ]
+    return get_fax_evaluator(message.request).can_be_faxed(
+        message,
+        ignore_time=ignore_time,
+        ignore_signature=ignore_signature,
+        ignore_law=ignore_law,
     )
-    if message.id in already_faxed:
-        return False
-
-    return True
 
 
 def get_faxable_messages_from_foirequest(
     foirequest: FoiRequest, **kwargs
 ) -> List[FoiMessage]:
-    return [m for m in foirequest.messages if message_can_be_faxed(m, **kwargs)]
+    evaluator = get_fax_evaluator(foirequest)
+    return [m for m in evaluator.messages if evaluator.can_be_faxed(m, **kwargs)]
 
 
 def send_messages_of_request(foirequest: FoiRequest) -> None:
@@ -183,7 +308,7 @@ def send_messages_of_request(foirequest: FoiRequest) -> None:
 def create_fax_message(
     message: FoiMessage, ignore_time: bool = False, ignore_law: bool = False
 ) -> FoiMessage:
-    from .tasks import send_fax_message_task
+    from .tasks import render_fax_message_task
 
     if not message_can_be_faxed(
         message, ignore_time=ignore_time, ignore_law=ignore_law
@@ -199,14 +324,15 @@ def create_fax_message(
         sender_user=message.sender_user,
         sender_name=message.sender_name,
         sender_email=message.sender_email,
-        recipient_email=message.recipient_public_body.fax,
+        recipient_email=ensure_fax_number(message.recipient_public_body),
         recipient_public_body=message.recipient_public_body,
         recipient=message.recipient,
         timestamp=timezone.now(),
         plaintext="",
         original=message,
     )
-    transaction.on_commit(partial(send_fax_message_task.delay, fax_message.pk))
+    get_fax_evaluator(message.request).mark_faxed(message)
+    transaction.on_commit(partial(render_fax_message_task.delay, fax_message.pk))
     return fax_message
 
 
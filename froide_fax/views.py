@@ -1,41 +1,36 @@
-import datetime
 import json
 
-from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.http import (
-    HttpRequest,
-    HttpResponse,
-    HttpResponseForbidden,
-    StreamingHttpResponse,
-)
+from django.http import Http404, HttpRequest, HttpResponse
 from django.shortcuts import get_object_or_404, redirect
-from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
 from django.views.generic import FormView
 
-import pytz
-import requests
-from nacl.encoding import Base64Encoder
-from nacl.exceptions import BadSignatureError
-from nacl.signing import VerifyKey
-
 from froide.foirequest.auth import can_write_foirequest
-from froide.foirequest.models import DeliveryStatus, FoiAttachment, FoiMessage
+from froide.foirequest.models import FoiAttachment, FoiMessage
 from froide.helper.utils import get_redirect_url
-from froide.problem.models import ProblemReport
 
 from froide_fax.fax import convert_to_fax_bytes
 
+from .callbacks import (
+    CALLBACK_MODE_QUEUE,
+    EVENT_UNKNOWN,
+    InvalidCallback,
+    enqueue_fax_event,
+    get_callback_mode,
+    process_fax_event,
+)
 from .forms import SignatureForm
+from .media import get_media_response
 from .models import FAX_PERMISSION
-from .pdf_generator import FaxReportPDFGenerator
+from .providers import get_fax_provider
+from .report import get_fax_report
+from .retries import cancel_fax_retries
 from .tasks import retry_fax_delivery
 from .utils import (
-    create_fax_log,
     create_fax_message,
     message_can_be_faxed,
     message_can_be_resend,
@@ -50,136 +45,50 @@ def fax_media_url(request, signed):
         return HttpResponse(status=403)
 
     attachment = get_object_or_404(FoiAttachment, pk=attachment_id)
-    url = attachment.get_absolute_domain_file_url(authorized=True)
 
     # Telnyx does not support redirects
-    # So stream response from CDN URL here
-    response = requests.get(url, stream=True)
-    return StreamingHttpResponse(
-        response.raw,
-        content_type=response.headers.get("content-type"),
-        status=response.status_code,
-        reason=response.reason,
+    # So let the front-end server send local files or stream from CDN URL
+    url = attachment.get_absolute_domain_file_url(authorized=True)
+    return get_media_response(
+        request,
+        attachment.file,
+        attachment.filetype or "application/pdf",
+        url=url,
+        size=attachment.size,
     )
 
 
 @csrf_exempt
 @require_POST
-def fax_status_callback(request: HttpRequest):
-    # get relevant signature data
-    event_timestamp = request.headers.get("Telnyx-Timestamp")
-    event_signature = request.headers.get("Telnyx-Signature-Ed25519")
-    public_key = settings.TELNYX_PUBLIC_KEY
-
-    # prepare signature data for nacl
-    verify_key = VerifyKey(public_key, encoder=Base64Encoder)
-    callback_bytes = f"{event_timestamp}|".encode("UTF-8") + request.body
-    signature = Base64Encoder.decode(event_signature)
-
-    # verify signature
-    try:
-        verify_key.verify(callback_bytes, signature=signature)
-    except BadSignatureError:
-        return HttpResponseForbidden("invalid signature", content_type="text/plain")
-
-    payload_json = json.loads(request.body)
+def fax_status_callback(request: HttpRequest, provider="telnyx"):
+    fax_provider = get_fax_provider(provider)
+    if fax_provider is None:
+        raise Http404
 
-    # get message object
-    fax_id = None
     try:
-        fax_id = payload_json.get("data").get("payload").get("fax_id")
-    except AttributeError as e:
-        # this key should always exist. we should never end up here
-        raise ValueError(
-            f"This is not a valid API response body: {request.body}"
-        ) from e
+        event_timestamp = fax_provider.verify_callback(request)
+    except InvalidCallback as e:
+        return HttpResponse(e.msg, status=e.status, content_type="text/plain")
 
-    if not fax_id:
-        raise ValueError(f"This is not a valid API response body: {request.body}")
+    payload_json = json.loads(request.body)
 
-    fax_message: FoiMessage = get_object_or_404(FoiMessage, email_message_id=fax_id)
+    # validate before queueing or applying
+    event = fax_provider.parse_event(payload_json, event_timestamp)
 
-    # find status
-    try:
-        status = payload_json.get("data").get("payload").get("status")
-    except AttributeError as e:
-        # we should never end up here either
-        raise ValueError(
-            f"This is not a valid API response body: {request.body}"
-        ) from e
-
-    if status == "failed":
-        status = DeliveryStatus.Delivery.STATUS_FAILED
-    elif status == "queued":
-        status = DeliveryStatus.Delivery.STATUS_SENDING
-    elif status == "media.processed":
-        status = DeliveryStatus.Delivery.STATUS_SENDING
-    elif status.startswith("sending"):
-        status = DeliveryStatus.Delivery.STATUS_SENDING
-    elif status == "delivered":
-        status = DeliveryStatus.Delivery.STATUS_SENT
-    else:
-        # again: we should not end up here. according to telnyx-docu those
-        # are all possible stati
-        raise ValueError(f"This is not a valid status response: {status}")
-
-    # only try and update if the timestamp in request is more recent than
-    # the one in the database
-    dt = datetime.datetime.fromtimestamp(int(event_timestamp), pytz.timezone("UTC"))
-    if fax_message.deliverystatus.last_update > dt:
-        return HttpResponse(status=409)
-
-    ds, _created = DeliveryStatus.objects.update_or_create(
-        message=fax_message,
-        defaults=dict(
-            status=status,
-            last_update=timezone.now(),
-        ),
-    )
-    data = payload_json.get("data")
-
-    # Create machine-readable log
-    fax_log_data = {
-        "from_": data["payload"]["from"],
-        "to": data["payload"]["to"],
-        "sid": data["payload"]["fax_id"],
-        "status": data["payload"]["status"],
-        "num_pages": data["payload"].get("page_count", 0),
-        "duration": data["payload"].get("call_duration_secs", 0),
-        "failure_reason": data["payload"].get("failure_reason"),
-        "date_created": data["occurred_at"],
-    }
-    ds.log = create_fax_log(ds.log, fax_log_data)
-    ds.save()
-
-    if status == DeliveryStatus.Delivery.STATUS_SENT:
-        fax_message.timestamp = ds.last_update
-        fax_message.save()
-        ProblemReport.objects.find_and_resolve(
-            message=fax_message, kind=ProblemReport.PROBLEM.BOUNCE_PUBLICBODY
+    if get_callback_mode() == CALLBACK_MODE_QUEUE:
+        enqueue_fax_event(
+            payload_json,
+            event_timestamp,
+            event_id=event["event_id"],
+            provider=fax_provider.name,
         )
+        return HttpResponse(status=200)
 
-    failed = False
-    if status == DeliveryStatus.Delivery.STATUS_FAILED:
-        if ds.retry_count >= 3:
-            failed = True
-        else:
-            # Retry fax delivery in 15 minutes
-            retry_fax_delivery.apply_async(
-                (fax_message.pk,),
-                {},
-                # resend in intervals of 0.25, 1, 2 and 4 hours
-                countdown=15 * 60 * 4**ds.retry_count,
-            )
-
-    if failed:
-        ProblemReport.objects.report(
-            message=fax_message,
-            kind=ProblemReport.PROBLEM.BOUNCE_PUBLICBODY,
-            description=ds.log,
-            auto_submitted=True,
-        )
+    outcome = process_fax_event(event)
+    if outcome == EVENT_UNKNOWN:
+        raise Http404
 
+    # Duplicate and stale events are acknowledged so they are not redelivered
     return HttpResponse(status=200)
 
 
@@ -234,6 +143,7 @@ def resend_fax(request, message_id):
     if not message_can_be_resend(message):
         return HttpResponse(status=400)
 
+    cancel_fax_retries(message)
     retry_fax_delivery.delay(message.pk)
 
     return redirect(message)
@@ -259,10 +169,14 @@ def pdf_report(request, message_id):
     if not message_can_get_fax_report(message):
         return HttpResponse(status=404)
 
-    pdf_generator = FaxReportPDFGenerator(message)
+    report = get_fax_report(message)
 
-    response = HttpResponse(
-        pdf_generator.get_pdf_bytes(), content_type="application/pdf"
+    response = get_media_response(
+        request,
+        report.report,
+        "application/pdf",
+        size=report.report_size,
+        last_modified=report.timestamp,
     )
     response["Content-Disposition"] = (
         "attachment; " 'filename="fax-report-%s.pdf"' % message.pk